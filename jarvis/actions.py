@@ -5,20 +5,8 @@ import os
 from interpreter import interpreter
 
 from .config import Settings
-
-
-def _get_ollama_models(base: str) -> list[str]:
-    try:
-        import urllib.request
-        import json as _json
-
-        with urllib.request.urlopen(f"{base}/api/tags", timeout=2) as resp:
-            if resp.status != 200:
-                return []
-            data = _json.loads(resp.read().decode("utf-8", errors="ignore"))
-            return [m.get("name") for m in data.get("models", []) if m.get("name")]
-    except Exception:
-        return []
+from .context import context_window
+from .ollama import get_inventory
 
 
 def _pick_small_ollama_model(models: list[str]) -> str | None:
@@ -58,7 +46,7 @@ def configure_interpreter(settings: Settings) -> None:
 
         # 2. Maximize Capabilities
         interpreter.llm.supports_vision = True
-        interpreter.llm.context_window = 128000
+        interpreter.llm.context_window = context_window(settings.openai_model, override=settings.context_window)
         interpreter.llm.max_tokens = 4096
 
         # 3. Inject Superhuman System Prompt
@@ -77,6 +65,7 @@ def configure_interpreter(settings: Settings) -> None:
     interpreter.offline = True
     interpreter.llm.model = settings.ollama_model
     interpreter.llm.api_base = settings.ollama_base
+    interpreter.llm.context_window = settings.ollama_num_ctx
     interpreter.auto_run = True
     interpreter.system_message = (
         "You are an autonomous agent capable of controlling the mouse, keyboard, and "
@@ -86,13 +75,14 @@ def configure_interpreter(settings: Settings) -> None:
 
 
 def switch_to_small_ollama(settings: Settings) -> str | None:
-    models = _get_ollama_models(settings.ollama_base)
+    models = get_inventory(settings).models()
     picked = _pick_small_ollama_model(models)
     if not picked:
         return None
     interpreter.offline = True
     interpreter.llm.model = f"ollama/{picked}"
     interpreter.llm.api_base = settings.ollama_base
+    interpreter.llm.context_window = settings.ollama_num_ctx
     return picked
 
     # NOTE: Do not overwrite interpreter.computer with a bool.
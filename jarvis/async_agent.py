@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from openai import AsyncOpenAI
+
+from .openai_agent import _DESKTOP_LOCK, TOOLS, _SERIAL_TOOLS, _execute_tool, _field, _tool_output
+from .tool_cache import MUTATING_TOOLS
+
+
+async def _run_command(command: str, cwd: str | None = None, timeout: int = 120) -> str:
+    if os.getenv("JARVIS_ALLOW_SHELL", "0") != "1":
+        return "error: shell disabled (set JARVIS_ALLOW_SHELL=1)"
+    proc = await asyncio.create_subprocess_shell(
+        command, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return f"error: command timed out after {timeout}s"
+    return (stdout.decode(errors="ignore") + "\n" + stderr.decode(errors="ignore")).strip()
+
+
+_ASYNC_TOOLS = {"run_command": _run_command}
+
+# The SDK re-validates typed params on every call, which for the full tool
+# schema costs tens of milliseconds of CPU per request and caps a single event
+# loop far below the API's own latency. The schema is static, so it is passed
+# through as raw JSON instead.
+_TOOLS_BODY = {"tools": TOOLS}
+
+
+@dataclass
+class AsyncOpenAIAgent:
+    """OpenAIAgent on the async client: one event loop can drive many tool loops.
+
+    Tools with a native coroutine (``run_command``) are awaited directly; the
+    rest are blocking and run on ``executor``. Desktop tools still go one at a
+    time, in the order the model issued them, and writes and commands are
+    ordered against the other calls of their turn as in OpenAIAgent.
+    """
+
+    model: str = "gpt-4.1-2025-04-14"
+    instructions: str = (
+        "You are Jarvis, a world-class autonomous software engineer. "
+        "Use tools when needed. Always verify changes before finalizing."
+    )
+    client: Any = None
+    executor: Optional[ThreadPoolExecutor] = None
+    _owns_executor: bool = field(default=False, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.client is None:
+            self.client = AsyncOpenAI()
+        if self.executor is None:
+            workers = int(os.getenv("JARVIS_TOOL_CONCURRENCY", "4"))
+            self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="jarvis-atool")
+            self._owns_executor = True
+
+    async def run(self, prompt: str, instructions: str | None = None) -> str:
+        text, _ = await self.run_turn(prompt, instructions=instructions)
+        return text
+
+    async def run_turn(
+        self, prompt: str, previous_response_id: str | None = None, instructions: str | None = None
+    ) -> Tuple[str, Optional[str]]:
+        """Run the tool loop for one user turn and return (text, last response id)."""
+        request: Dict[str, Any] = {"input": [{"role": "user", "content": prompt}]}
+        if previous_response_id:
+            request["previous_response_id"] = previous_response_id
+        final_text = ""
+        while True:
+            response = await self.client.responses.create(
+                model=self.model,
+                instructions=instructions or self.instructions,
+                tool_choice="auto",
+                truncation="auto",
+                extra_body=_TOOLS_BODY,
+                **request,
+            )
+            tool_calls = []
+            for item in _field(response, "output", []) or []:
+                if _field(item, "type") == "message":
+                    for part in _field(item, "content", []) or []:
+                        if _field(part, "type") == "output_text":
+                            final_text += _field(part, "text", "")
+                elif _field(item, "type") == "function_call":
+                    tool_calls.append(_as_call(item))
+            response_id = _field(response, "id")
+            if not tool_calls:
+                return final_text.strip(), response_id
+            outputs = await self._call_tools(tool_calls)
+            request = {"input": outputs, "previous_response_id": response_id}
+
+    async def stream(self, prompt: str, instructions: str | None = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async counterpart of OpenAIAgent.stream with the same event shapes."""
+        final_text = ""
+        request: Dict[str, Any] = {"input": [{"role": "user", "content": prompt}]}
+        while True:
+            pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+            lane: List[asyncio.Future] = []
+            barrier: List[asyncio.Future] = []
+            response_id = None
+            events = await self.client.responses.create(
+                model=self.model,
+                instructions=instructions or self.instructions,
+                tool_choice="auto",
+                truncation="auto",
+                extra_body=_TOOLS_BODY,
+                stream=True,
+                **request,
+            )
+            async for event in events:
+                kind = _field(event, "type")
+                if kind == "response.output_text.delta":
+                    delta = _field(event, "delta", "")
+                    final_text += delta
+                    yield {"type": "text", "delta": delta}
+                elif kind == "response.output_item.done":
+                    item = _field(event, "item")
+                    if _field(item, "type") != "function_call":
+                        continue
+                    call = _as_call(item)
+                    if call["name"] in MUTATING_TOOLS:
+                        future = asyncio.ensure_future(self._call_after([f for _, f in pending], call))
+                        barrier = [future]
+                    elif call["name"] in _SERIAL_TOOLS:
+                        # Chain desktop calls so each starts only after the previous one.
+                        future = asyncio.ensure_future(self._call_after(barrier + lane, call))
+                        lane = [future]
+                    else:
+                        future = asyncio.ensure_future(self._call_after(barrier, call))
+                    pending.append((call, future))
+                    yield {"type": "tool_call", **call}
+                elif kind == "response.completed":
+                    response_id = _field(_field(event, "response"), "id")
+                elif kind in ("response.failed", "error"):
+                    error = _field(_field(event, "response"), "error") or _field(event, "message")
+                    raise RuntimeError(f"response failed: {error}")
+            if not pending:
+                break
+            outputs = []
+            for call, future in pending:
+                output = await future
+                outputs.append(output)
+                yield {"type": "tool_result", "call_id": output["call_id"], "output": output["output"]}
+            request = {"input": outputs, "previous_response_id": response_id}
+        yield {"type": "done", "text": final_text.strip()}
+
+    async def close(self) -> None:
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+        if self._owns_executor and self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    async def _call_tools(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # A write or command runs alone: after every call before it and before any call after it.
+        outputs: List[Dict[str, Any]] = []
+        batch: List[Dict[str, Any]] = []
+        for call in tool_calls:
+            if call["name"] in MUTATING_TOOLS:
+                outputs.extend(await self._call_batch(batch))
+                outputs.append(await self._call_tool(call))
+                batch = []
+            else:
+                batch.append(call)
+        outputs.extend(await self._call_batch(batch))
+        return outputs
+
+    async def _call_batch(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        serial = [call for call in tool_calls if call["name"] in _SERIAL_TOOLS]
+        tasks = [self._call_tool(call) for call in tool_calls if call["name"] not in _SERIAL_TOOLS]
+        if serial:
+            tasks.append(self._call_serial(serial))
+        done = await asyncio.gather(*tasks)
+        by_id = {}
+        for result in done:
+            for output in result if isinstance(result, list) else [result]:
+                by_id[output["call_id"]] = output
+        # Outputs keep the order of the calls, whatever order they finished in.
+        return [by_id[call["call_id"]] for call in tool_calls if call["call_id"] in by_id]
+
+    async def _call_after(self, previous: Sequence[asyncio.Future], call: Dict[str, Any]) -> Dict[str, Any]:
+        if previous:
+            await asyncio.wait(previous)
+        return await self._call_tool(call)
+
+    async def _call_serial(self, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _run_desktop_batch, calls, self.model)
+
+    async def _call_tool(self, call: Dict[str, Any]) -> Dict[str, Any]:
+        native = _ASYNC_TOOLS.get(call["name"])
+        if native is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, _execute_tool, call, self.model)
+        try:
+            result: Any = await native(**json.loads(call.get("arguments") or "{}"))
+        except Exception as exc:
+            result = f"error: {exc}"
+        return _tool_output(call, result, self.model)
+
+
+def _run_desktop_batch(calls: List[Dict[str, Any]], model: str) -> List[Dict[str, Any]]:
+    # One lock hold for the whole batch, as in OpenAIAgent, so another agent's
+    # desktop input cannot land between these calls.
+    with _DESKTOP_LOCK:
+        return [_execute_tool(call, model) for call in calls]
+
+
+def _as_call(item: Any) -> Dict[str, Any]:
+    return {
+        "name": _field(item, "name"),
+        "call_id": _field(item, "call_id"),
+        "arguments": _field(item, "arguments", "{}"),
+    }
+
+
+@dataclass
+class _Session:
+    lock: asyncio.Lock
+    response_id: Optional[str] = None
+    last_used: float = 0.0
+    turns: int = 0
+
+
+class AgentSessionManager:
+    """Run many concurrent agent conversations on one event loop.
+
+    All sessions share one async client (and its connection pool) and one
+    tool executor. Turns within a session are serialised so each continues
+    from the previous response; ``max_active`` bounds turns in flight across
+    sessions, and idle sessions beyond ``max_sessions`` are dropped LRU-first.
+    """
+
+    def __init__(
+        self,
+        agent: Optional[AsyncOpenAIAgent] = None,
+        max_active: int = 256,
+        max_sessions: int = 10_000,
+    ) -> None:
+        self.agent = agent or AsyncOpenAIAgent()
+        self.max_sessions = max(1, max_sessions)
+        self._active = asyncio.Semaphore(max(1, max_active))
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._counters = {"turns": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    async def send(self, session_id: str, prompt: str) -> str:
+        session = self._session(session_id)
+        async with session.lock, self._active:
+            self._counters["in_flight"] += 1
+            self._counters["peak_in_flight"] = max(self._counters["peak_in_flight"], self._counters["in_flight"])
+            try:
+                text, session.response_id = await self.agent.run_turn(prompt, session.response_id)
+                session.turns += 1
+                self._counters["turns"] += 1
+                return text
+            except Exception as exc:
+                self._counters["errors"] += 1
+                return f"error: {exc}"
+            finally:
+                self._counters["in_flight"] -= 1
+                session.last_used = time.time()
+
+    async def send_many(self, requests: List[Tuple[str, str]]) -> List[str]:
+        return list(await asyncio.gather(*(self.send(session_id, prompt) for session_id, prompt in requests)))
+
+    def reset(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "sessions": len(self._sessions)}
+
+    async def close(self) -> None:
+        await self.agent.close()
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session(lock=asyncio.Lock())
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                oldest, idle = next(iter(self._sessions.items()))
+                if idle.lock.locked():
+                    break
+                self._sessions.pop(oldest)
+        self._sessions.move_to_end(session_id)
+        return session
@@ -0,0 +1,132 @@
+"""Throughput benchmark for AgentSessionManager against a local fake Responses API.
+
+    python -m jarvis.bench_agents --sessions 1 10 50 200 --latency 0.05
+
+Each session runs one turn: the fake model asks for ``list_files`` and then
+answers, so a turn costs two API round-trips plus one tool call.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from openai import AsyncOpenAI
+
+from .async_agent import AgentSessionManager, AsyncOpenAIAgent
+
+
+class _FakeResponses(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+    tool_path = "."
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.latency)
+        items = body.get("input") or []
+        if any(isinstance(i, dict) and i.get("type") == "function_call_output" for i in items):
+            output = [
+                {
+                    "type": "message",
+                    "id": "msg_1",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": "done", "annotations": []}],
+                }
+            ]
+        else:
+            output = [
+                {
+                    "type": "function_call",
+                    "id": "fc_1",
+                    "call_id": "call_1",
+                    "name": "list_files",
+                    "arguments": json.dumps({"path": self.tool_path, "limit": 5}),
+                    "status": "completed",
+                }
+            ]
+        payload = json.dumps(
+            {
+                "id": f"resp_{time.monotonic_ns()}",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": body.get("model", "fake"),
+                "status": "completed",
+                "output": output,
+                "parallel_tool_calls": True,
+                "tool_choice": "auto",
+                "tools": [],
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: object) -> None:
+        return
+
+
+class _FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+async def _bench(base_url: str, sessions: int) -> float:
+    agent = AsyncOpenAIAgent(model="fake", client=AsyncOpenAI(base_url=base_url, api_key="fake", max_retries=0))
+    manager = AgentSessionManager(agent, max_active=sessions)
+    started = time.perf_counter()
+    replies = await manager.send_many([(f"s{i}", "list a few files") for i in range(sessions)])
+    elapsed = time.perf_counter() - started
+    await manager.close()
+    failed = [r for r in replies if r != "done"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} sessions failed, first: {failed[0]}")
+    return elapsed
+
+
+def _serve(latency: float, tool_path: str, ports: "multiprocessing.Queue") -> None:
+    _FakeResponses.latency = latency
+    _FakeResponses.tool_path = tool_path
+    server = _FakeServer(("127.0.0.1", 0), _FakeResponses)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="jarvis.bench_agents")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake API latency per request (s)")
+    args = parser.parse_args(argv)
+
+    # A tiny directory keeps the tool cheap, so the numbers measure the agent loop.
+    with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as workdir:
+        for index in range(5):
+            with open(os.path.join(workdir, f"file{index}.txt"), "w", encoding="utf-8") as handle:
+                handle.write("x")
+        # The fake API runs in its own process so it does not compete for the GIL.
+        ports: "multiprocessing.Queue" = multiprocessing.Queue()
+        server = multiprocessing.Process(target=_serve, args=(args.latency, workdir, ports), daemon=True)
+        server.start()
+        base_url = f"http://127.0.0.1:{ports.get(timeout=10)}/v1"
+        try:
+            print(f"{'sessions':>8} {'seconds':>8} {'turns/s':>8}")
+            for count in args.sessions:
+                elapsed = asyncio.run(_bench(base_url, count))
+                print(f"{count:>8} {elapsed:>8.2f} {count / elapsed:>8.1f}")
+        finally:
+            server.terminate()
+            server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .memory import MemoryStore
+
+
+class ResponseCache:
+    """LRU + TTL cache for LLM replies, optionally backed by MemoryStore."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, store: Optional[MemoryStore] = None) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "bypassed": 0}
+
+    @staticmethod
+    def make_key(
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        packs: Optional[List[str]] = None,
+    ) -> str:
+        raw = json.dumps([model, prompt, options or {}, mode or "", sorted(packs or [])], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                del self._entries[key]
+        if self.store is not None:
+            row = self.store.get_response(key)
+            if row is not None and now - row[1] <= self.ttl:
+                with self._lock:
+                    self._insert(key, row[0], row[1])
+                    self._counters["hits"] += 1
+                    self._counters["disk_hits"] += 1
+                return row[0]
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._insert(key, value, now)
+        if self.store is not None:
+            self.store.put_response(key, value)
+
+    def note_bypass(self) -> None:
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def prune(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [k for k, (_, created_at) in self._entries.items() if created_at < cutoff]
+            for key in expired:
+                del self._entries[key]
+        removed = len(expired)
+        if self.store is not None:
+            removed += self.store.prune_responses(cutoff)
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.clear_responses()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counters)
+            out["entries"] = len(self._entries)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 3) if lookups else 0.0
+        out["persistent"] = self.store is not None
+        return out
+
+    def _insert(self, key: str, value: str, created_at: float) -> None:
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
@@ -2,7 +2,6 @@
 
 import argparse
 import os
-import socket
 import subprocess
 import sys
 import webbrowser
@@ -12,16 +11,11 @@ if __package__ is None or __package__ == "":
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from jarvis.config import get_settings
+from jarvis.protocol import send_command, stream_command
 from jarvis.runner import run_interactive, serve
 from jarvis.web import run_ui
 
 
-def _send_command(host: str, port: int, message: str) -> str:
-    with socket.create_connection((host, port), timeout=2.0) as sock:
-        sock.sendall((message + "\n").encode("utf-8"))
-        return sock.recv(4096).decode("utf-8", errors="ignore").strip()
-
-
 def _spawn_detached(args: list[str]) -> None:
     subprocess.Popen(
         args,
@@ -42,6 +36,8 @@ def main() -> None:
 
     send_parser = sub.add_parser("send", help="Send a command to running server")
     send_parser.add_argument("message")
+    send_parser.add_argument("--session", help="Continue a conversation session")
+    send_parser.add_argument("--stream", action="store_true", help="Print the reply as it is generated")
 
     ui_parser = sub.add_parser("ui", help="Run web UI")
     ui_parser.add_argument("--host", default="127.0.0.1")
@@ -59,7 +55,16 @@ def main() -> None:
         return
 
     if args.cmd == "send":
-        response = _send_command(settings.server_host, settings.server_port, args.message)
+        if args.stream:
+            for delta in stream_command(
+                settings.server_host, settings.server_port, args.message, timeout=120.0, session=args.session
+            ):
+                print(delta, end="", flush=True)
+            print()
+            return
+        response = send_command(
+            settings.server_host, settings.server_port, args.message, timeout=120.0, session=args.session
+        )
         print(response)
         return
 
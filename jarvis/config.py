@@ -36,11 +36,40 @@ class Settings:
     data_dir: str = _env("JARVIS_DATA_DIR", os.path.join(os.getcwd(), "data"))
     memory_db: str = _env("JARVIS_MEMORY_DB", os.path.join(os.getcwd(), "data", "memory.db"))
     log_file: str = _env("JARVIS_LOG_FILE", os.path.join(os.getcwd(), "data", "jarvis.log"))
+    events_retention_days: float = float(_env("JARVIS_EVENTS_RETENTION_DAYS", "30"))
+    events_archive_dir: str = _env("JARVIS_EVENTS_ARCHIVE_DIR", os.path.join(os.getcwd(), "data", "archive"))
+    session_ttl_days: float = float(_env("JARVIS_SESSION_TTL_DAYS", "7"))
+    packs_dir: str = _env("JARVIS_PACKS_DIR", os.path.join(os.getcwd(), "data", "packs"))
+    pack_reload_interval: float = float(_env("JARVIS_PACK_RELOAD_INTERVAL", "5"))
+    pack_top_k: int = int(_env("JARVIS_PACK_TOP_K", "4"))
+    pack_token_budget: int = int(_env("JARVIS_PACK_TOKEN_BUDGET", "300"))
+    semantic_memory: bool = _env("JARVIS_SEMANTIC_MEMORY", "0") == "1"
+    embed_model: str = _env("JARVIS_EMBED_MODEL", "nomic-embed-text")
+    semantic_top_k: int = int(_env("JARVIS_SEMANTIC_TOP_K", "3"))
+    semantic_min_score: float = float(_env("JARVIS_SEMANTIC_MIN_SCORE", "0.3"))
+    context_window: int = int(_env("JARVIS_CONTEXT_WINDOW", "0"))
+    context_reserve: int = int(_env("JARVIS_CONTEXT_RESERVE", "1024"))
+    history_search_limit: int = int(_env("JARVIS_HISTORY_SEARCH_LIMIT", "10"))
+    memory_async_events: bool = _env("JARVIS_MEMORY_ASYNC_EVENTS", "1") == "1"
     ollama_base: str = _env("JARVIS_OLLAMA_BASE", "http://localhost:11434")
     ollama_model: str = _env("JARVIS_OLLAMA_MODEL", "ollama/llama3.2-vision")
+    ollama_chat_model: str = _env("JARVIS_OLLAMA_CHAT_MODEL", "gemma:2b")
+    ollama_num_ctx: int = int(_env("JARVIS_OLLAMA_NUM_CTX", "4096"))
+    ollama_timeout: float = float(_env("JARVIS_OLLAMA_TIMEOUT", "120"))
+    ollama_connect_timeout: float = float(_env("JARVIS_OLLAMA_CONNECT_TIMEOUT", "5"))
+    ollama_keep_alive: str = _env("JARVIS_OLLAMA_KEEP_ALIVE", "30m")
+    ollama_max_concurrency: int = int(_env("JARVIS_OLLAMA_MAX_CONCURRENCY", "4"))
+    ollama_queue_size: int = int(_env("JARVIS_OLLAMA_QUEUE_SIZE", "16"))
+    ollama_queue_timeout: float = float(_env("JARVIS_OLLAMA_QUEUE_TIMEOUT", "30"))
+    ollama_inventory_ttl: float = float(_env("JARVIS_OLLAMA_INVENTORY_TTL", "60"))
+    ollama_warmup: bool = _env("JARVIS_OLLAMA_WARMUP", "1") == "1"
     openai_model: str = _env("JARVIS_OPENAI_MODEL", "gpt-4o")
     server_host: str = _env("JARVIS_SERVER_HOST", "127.0.0.1")
     server_port: int = int(_env("JARVIS_SERVER_PORT", "8123"))
+    cache_size: int = int(_env("JARVIS_CACHE_SIZE", "256"))
+    cache_ttl: float = float(_env("JARVIS_CACHE_TTL", "3600"))
+    cache_persist: bool = _env("JARVIS_CACHE_PERSIST", "1") == "1"
+    server_workers: int = int(_env("JARVIS_SERVER_WORKERS", "8"))
 
 
 def get_settings() -> Settings:
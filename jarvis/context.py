@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .tokens import TokenCounter, token_counter
+
+# Prefix -> context window in tokens; the first match wins, so list specific names first.
+_WINDOWS: Sequence[Tuple[str, int]] = (
+    ("gpt-4.1", 1_047_576),
+    ("gpt-4o", 128_000),
+    ("gpt-4-turbo", 128_000),
+    ("gpt-4", 8_192),
+    ("gpt-3.5", 16_385),
+    ("o1", 200_000),
+    ("o3", 200_000),
+    ("o4", 200_000),
+)
+DEFAULT_WINDOW = 128_000
+
+
+def context_window(model: str, local_window: int = 4096, override: int = 0) -> int:
+    if override > 0:
+        return override
+    name = (model or "").lower()
+    if name.startswith("ollama/") or ":" in name:
+        return local_window
+    for prefix, window in _WINDOWS:
+        if name.startswith(prefix):
+            return window
+    return DEFAULT_WINDOW
+
+
+def truncate_tokens(text: str, max_tokens: int, count: TokenCounter, keep: str = "head") -> str:
+    """Cut ``text`` to at most ``max_tokens`` keeping the head, tail, or both ends."""
+    total = count(text)
+    if total <= max_tokens:
+        return text
+    marker = f"\n...[trimmed ~{total - max_tokens} tokens]...\n"
+    budget = max_tokens - count(marker)
+    if budget <= 0:
+        return ""
+    size = int(len(text) * budget / total)
+    while size > 0:
+        if keep == "tail":
+            candidate = marker.lstrip() + text[-size:]
+        elif keep == "middle":
+            half = size // 2
+            candidate = text[:half] + marker + text[len(text) - (size - half) :]
+        else:
+            candidate = text[:size] + marker.rstrip()
+        if count(candidate) <= max_tokens:
+            return candidate
+        size = int(size * 0.9)
+    return ""
+
+
+class ContextBudget:
+    """Fit prompt sections into a model's window, trimming the least important first.
+
+    Sections are ``(name, text, keep)`` tuples in prompt order; ``trim_order``
+    lists the names that may be cut, most expendable first. Anything not in
+    ``trim_order`` is only cut as a last resort.
+    """
+
+    def __init__(self, model: str, window: int, reserve: int = 1024) -> None:
+        self.model = model
+        self.window = window
+        self.reserve = reserve
+        self.count = token_counter(model)
+
+    @property
+    def limit(self) -> int:
+        return max(0, self.window - self.reserve)
+
+    def fit(
+        self,
+        sections: List[Tuple[str, str, str]],
+        trim_order: Sequence[str] = (),
+        known: Optional[Dict[str, int]] = None,
+    ) -> Tuple[str, Dict[str, int]]:
+        known = known or {}
+        sizes = {name: known[name] if name in known else self.count(text) for name, text, _ in sections}
+        texts = {name: text for name, text, _ in sections}
+        modes = {name: keep for name, _, keep in sections}
+        total = sum(sizes.values())
+        trimmed: Dict[str, int] = {}
+        order = list(trim_order) + [name for name, _, _ in sections if name not in trim_order]
+        for name in order:
+            if total <= self.limit:
+                break
+            excess = total - self.limit
+            target = max(0, sizes[name] - excess)
+            cut = truncate_tokens(texts[name], target, self.count, modes[name])
+            new_size = self.count(cut)
+            total -= sizes[name] - new_size
+            trimmed[name] = sizes[name] - new_size
+            texts[name], sizes[name] = cut, new_size
+        if trimmed:
+            logging.info("context trimmed for %s: %s (limit %s)", self.model, trimmed, self.limit)
+        return "".join(texts[name] for name, _, _ in sections), trimmed
+
+    def trim_history(self, context: List[int], prompt_tokens: int) -> List[int]:
+        """Keep the most recent Ollama context tokens that still leave room for the prompt."""
+        room = self.limit - prompt_tokens
+        if len(context) <= room:
+            return context
+        logging.info("session context trimmed from %s to %s tokens", len(context), max(0, room))
+        return context[-room:] if room > 0 else []
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class LimiterRejected(Exception):
+    pass
+
+
+class Slot:
+    """One admitted call. Callers may set ``latency`` to the part of the call
+    that reflects load, such as the time to the first token; otherwise the
+    whole call is measured."""
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.latency: Optional[float] = None
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded wait queue.
+
+    The limit grows by one slot per "window" of successful calls made while
+    the limiter was saturated, and is cut multiplicatively when a call fails
+    with an overload signal or its latency exceeds ``latency_target``. Callers
+    beyond the limit wait in a queue of at most ``max_queue`` entries; once
+    the queue is full new callers are rejected immediately. The limit is per
+    process, so the runner and the web UI each keep their own.
+    """
+
+    def __init__(
+        self,
+        initial: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        max_queue: int = 16,
+        queue_timeout: float = 30.0,
+        latency_target: float = 60.0,
+        backoff: float = 0.5,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._inflight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._counters = {"admitted": 0, "rejected": 0, "timeouts": 0, "decreases": 0, "increases": 0}
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            if self._inflight >= self.limit:
+                if self._waiting >= self.max_queue:
+                    self._counters["rejected"] += 1
+                    raise LimiterRejected("ollama busy: request queue is full")
+                self._waiting += 1
+                try:
+                    while self._inflight >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["timeouts"] += 1
+                            raise LimiterRejected("ollama busy: timed out waiting for a slot")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._inflight += 1
+            self._counters["admitted"] += 1
+            return time.monotonic()
+
+    def release(self, started: float, overloaded: bool = False, latency: Optional[float] = None) -> None:
+        if latency is None:
+            latency = time.monotonic() - started
+        with self._cond:
+            saturated = self._inflight >= self.limit
+            self._inflight -= 1
+            if overloaded or latency > self.latency_target:
+                self._limit = max(float(self.min_limit), self._limit * self.backoff)
+                self._counters["decreases"] += 1
+            elif saturated and self._limit < self.max_limit:
+                before = self.limit
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                if self.limit > before:
+                    self._counters["increases"] += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[Slot]:
+        slot = Slot(self.acquire(timeout))
+        overloaded = False
+        try:
+            yield slot
+        except (TimeoutError, ConnectionError):
+            overloaded = True
+            raise
+        finally:
+            self.release(slot.started, overloaded, slot.latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._counters)
+            out.update(
+                {
+                    "limit": self.limit,
+                    "inflight": self._inflight,
+                    "queue_depth": self._waiting,
+                    "max_queue": self.max_queue,
+                }
+            )
+        return out
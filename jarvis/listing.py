@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import os
+import re
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+
+# Directories that are never worth listing for an agent, whatever .gitignore says.
+DEFAULT_IGNORED_DIRS = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        "node_modules",
+        "__pycache__",
+        ".venv",
+        "venv",
+        ".tox",
+        ".nox",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".ruff_cache",
+    }
+)
+
+
+class Listing(list):
+    """A list of results that also remembers what was read to produce it.
+
+    ``dirs`` holds ``(path, mtime_ns)`` for every directory scanned and every
+    .gitignore applied, which is enough to tell later whether the listing
+    could have changed.
+    """
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+        self.dirs: List[Tuple[str, int]] = []
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(char))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """The subset of .gitignore semantics that matters for pruning a walk.
+
+    Supports comments, ``!`` negation, trailing ``/`` for directories only,
+    anchoring by a leading or inner ``/``, and ``*``, ``?``, ``[...]`` and
+    ``**`` wildcards. The last matching rule wins, as in git.
+    """
+
+    def __init__(self) -> None:
+        self._rules: List[Tuple[str, "re.Pattern[str]", bool, bool]] = []
+
+    def load(self, path: str) -> None:
+        base = os.path.dirname(path).replace(os.sep, "/")
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as handle:
+                lines = handle.read().splitlines()
+        except OSError:
+            return
+        for raw in lines:
+            line = raw.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # A slash anywhere but the end anchors the pattern to the .gitignore's directory.
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            regex = _glob_to_regex(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self._rules.append((base, re.compile(regex + "$"), negate, dir_only))
+
+    def load_parents(self, start: str) -> List[Tuple[str, int]]:
+        """Apply .gitignore files from the enclosing repository above ``start``."""
+        parents = []
+        current = os.path.dirname(os.path.abspath(start))
+        while True:
+            parents.append(current)
+            if os.path.exists(os.path.join(current, ".git")):
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                # Not inside a repository: ancestor ignore files do not apply.
+                return []
+            current = parent
+        loaded = []
+        for directory in reversed(parents):
+            path = os.path.join(directory, ".gitignore")
+            try:
+                loaded.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                continue
+            self.load(path)
+        return loaded
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        path = path.replace(os.sep, "/")
+        result = False
+        for base, regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if not path.startswith(base + "/"):
+                continue
+            if regex.match(path[len(base) + 1 :]):
+                result = not negate
+        return result
+
+
+def _is_virtualenv(path: str) -> bool:
+    return os.path.exists(os.path.join(path, "pyvenv.cfg"))
+
+
+def walk_files(
+    base: str,
+    pattern: str = "*",
+    include_ignored: bool = False,
+    visited: Optional[List[Tuple[str, int]]] = None,
+) -> Iterator[os.DirEntry]:
+    """Yield files under ``base`` breadth-first, lazily, in name order.
+
+    Ignored directories are pruned before they are opened, so the cost of
+    taking the first N results tracks N rather than the size of the tree.
+    """
+    rules = IgnoreRules()
+    if not include_ignored:
+        loaded = rules.load_parents(base)
+        if visited is not None:
+            visited.extend(loaded)
+    # Same semantics as Path.rglob: the pattern matches the tail of the relative path.
+    regex = re.compile("(?:.*/)?" + _glob_to_regex(pattern) + "$")
+    pending = deque([base])
+    while pending:
+        directory = pending.popleft()
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        if visited is not None:
+            visited.append((directory, mtime))
+        if not include_ignored:
+            for entry in entries:
+                if entry.name == ".gitignore" and entry.is_file():
+                    rules.load(entry.path)
+                    if visited is not None:
+                        visited.append((entry.path, entry.stat().st_mtime_ns))
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if not include_ignored:
+                if is_dir and (entry.name in DEFAULT_IGNORED_DIRS or _is_virtualenv(entry.path)):
+                    continue
+                if rules.ignored(entry.path, is_dir):
+                    continue
+            if is_dir:
+                pending.append(entry.path)
+                continue
+            if not entry.is_file():
+                continue
+            if regex.match(os.path.relpath(entry.path, base).replace(os.sep, "/")):
+                yield entry
@@ -1,19 +1,186 @@
 ﻿from __future__ import annotations
 
+import gzip
+import json
+import logging
 import os
+import queue
 import sqlite3
+import threading
 import time
-from typing import Optional
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_STOP = object()
+_INSERT_EVENT = "INSERT INTO events (timestamp, event_type, payload) VALUES (?, ?, ?)"
+_INSERT_EXCHANGE = "INSERT INTO exchanges (timestamp, session, command, reply) VALUES (?, ?, ?, ?)"
+
+_Write = Tuple[str, Tuple[Any, ...]]
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only fsyncs at checkpoints, not on every commit.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class _EventWriter(threading.Thread):
+    """Background thread that group-commits queued inserts."""
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[_Write]], None],
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+    ) -> None:
+        super().__init__(name="jarvis-event-writer", daemon=True)
+        self._write_batch = write_batch
+        self.queue: "queue.Queue[object]" = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.written = 0
+
+    def run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch: List[_Write] = []
+            drained = 1
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+            while len(batch) < self.batch_size and not stopping:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                drained += 1
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+            try:
+                if batch:
+                    self._write_batch(batch)
+                    self.batches += 1
+                    self.written += len(batch)
+            except Exception:
+                logging.exception("event_write_failed")
+            finally:
+                for _ in range(drained):
+                    self.queue.task_done()
+
+
+def _events_query(
+    event_type: Optional[str], since: Optional[float], until: Optional[float], after_id: int, limit: int
+) -> Tuple[str, List[Any]]:
+    clauses = ["id > ?"]
+    params: List[Any] = [after_id]
+    if event_type is not None:
+        clauses.append("event_type = ?")
+        params.append(event_type)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    params.append(limit)
+    where = " AND ".join(clauses)
+    return f"SELECT id, timestamp, event_type, payload FROM events WHERE {where} ORDER BY id LIMIT ?", params
 
 
 class MemoryStore:
-    def __init__(self, db_path: str) -> None:
+    """SQLite-backed state shared by every server thread.
+
+    All writes go through one connection guarded by a lock; reads use a
+    read-only connection per thread, so readers never contend with each
+    other or see a half-finished write transaction.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        async_events: bool = True,
+        event_queue_size: int = 10_000,
+        event_batch_size: int = 256,
+        event_flush_interval: float = 0.5,
+    ) -> None:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._db_path = db_path
+        self._conn = _connect(db_path)
+        self._write_lock = threading.RLock()
+        self._readers: Dict[int, Tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._readers_lock = threading.Lock()
+        self._local = threading.local()
+        # Write-through cache over the kv table; SQLite stays authoritative.
+        self._kv_cache: Dict[str, Optional[str]] = {}
+        self._kv_version = 0
+        self._kv_lock = threading.Lock()
         self._init()
+        self._retention_stop = threading.Event()
+        self._retention: Optional[threading.Thread] = None
+        self._writer: Optional[_EventWriter] = None
+        if async_events:
+            self._writer = _EventWriter(self._write_batch, event_queue_size, event_batch_size, event_flush_interval)
+            self._writer.start()
+
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            with self._conn:
+                yield self._conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        uri = Path(self._db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=10.0)
+        self._local.conn = conn
+        current = threading.current_thread()
+        with self._readers_lock:
+            # Worker threads come and go; drop connections whose thread has exited.
+            for ident, (thread, stale) in list(self._readers.items()):
+                if not thread.is_alive():
+                    stale.close()
+                    del self._readers[ident]
+            self._readers[current.ident or id(current)] = (current, conn)
+        return conn
+
+    def _write_batch(self, batch: List[_Write]) -> None:
+        # One transaction per batch; consecutive rows for the same statement use executemany.
+        with self._writing() as conn:
+            start = 0
+            while start < len(batch):
+                sql = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == sql:
+                    end += 1
+                conn.executemany(sql, [params for _, params in batch[start:end]])
+                start = end
+
+    def _enqueue(self, sql: str, params: Tuple[Any, ...]) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            # Blocks only when the queue is full, which applies backpressure.
+            self._writer.queue.put((sql, params))
+            return
+        self._write_batch([(sql, params)])
 
     def _init(self) -> None:
-        cur = self._conn.cursor()
+        with self._writing() as conn:
+            self._create_tables(conn.cursor())
+
+    def _create_tables(self, cur: sqlite3.Cursor) -> None:
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS kv (
@@ -33,27 +200,363 @@ class MemoryStore:
             )
             """
         )
-        self._conn.commit()
+        # Keyset pages walk events in id order, so the type filter needs the id in its index.
+        cur.execute("DROP INDEX IF EXISTS idx_events_type_ts")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_type_id ON events (event_type, id)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS exchanges (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL NOT NULL,
+                session TEXT,
+                command TEXT NOT NULL,
+                reply TEXT NOT NULL
+            )
+            """
+        )
+        self._fts = self._create_fts(cur)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                ref TEXT UNIQUE,
+                text TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events (timestamp)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                context TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
 
-    def set(self, key: str, value: str) -> None:
-        cur = self._conn.cursor()
+    @property
+    def kv_version(self) -> int:
+        return self._kv_version
+
+    def _create_fts(self, cur: sqlite3.Cursor) -> bool:
+        try:
+            cur.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS exchanges_fts USING fts5("
+                "command, reply, content='exchanges', content_rowid='id')"
+            )
+        except sqlite3.OperationalError:
+            logging.warning("sqlite built without FTS5; history search falls back to LIKE")
+            return False
+        # External-content index kept in sync by triggers, so inserts stay a single statement.
         cur.execute(
-            "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) "
-            "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
-            (key, value, time.time()),
+            "CREATE TRIGGER IF NOT EXISTS exchanges_ai AFTER INSERT ON exchanges BEGIN "
+            "INSERT INTO exchanges_fts (rowid, command, reply) VALUES (new.id, new.command, new.reply); END"
         )
-        self._conn.commit()
+        cur.execute(
+            "CREATE TRIGGER IF NOT EXISTS exchanges_ad AFTER DELETE ON exchanges BEGIN "
+            "INSERT INTO exchanges_fts (exchanges_fts, rowid, command, reply) "
+            "VALUES ('delete', old.id, old.command, old.reply); END"
+        )
+        return True
+
+    def set(self, key: str, value: str) -> None:
+        with self._write_lock:
+            with self._writing() as conn:
+                conn.execute(
+                    "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+                    (key, value, time.time()),
+                )
+            with self._kv_lock:
+                self._kv_cache[key] = value
+                self._kv_version += 1
 
     def get(self, key: str) -> Optional[str]:
-        cur = self._conn.cursor()
+        with self._kv_lock:
+            if key in self._kv_cache:
+                return self._kv_cache[key]
+            version = self._kv_version
+        cur = self._reader().cursor()
         cur.execute("SELECT value FROM kv WHERE key=?", (key,))
         row = cur.fetchone()
-        return row[0] if row else None
+        value = row[0] if row else None
+        with self._kv_lock:
+            # Skip filling the cache if a set() landed while we were reading.
+            if self._kv_version == version:
+                self._kv_cache[key] = value
+        return value
+
+    def invalidate_kv(self) -> None:
+        with self._kv_lock:
+            self._kv_cache.clear()
+            self._kv_version += 1
 
     def log_event(self, event_type: str, payload: str) -> None:
-        cur = self._conn.cursor()
-        cur.execute(
-            "INSERT INTO events (timestamp, event_type, payload) VALUES (?, ?, ?)",
-            (time.time(), event_type, payload),
-        )
-        self._conn.commit()
+        self._enqueue(_INSERT_EVENT, (time.time(), event_type, payload))
+
+    def log_exchange(self, command: str, reply: str, session: Optional[str] = None) -> None:
+        self._enqueue(_INSERT_EXCHANGE, (time.time(), session, command, reply))
+
+    def search_exchanges(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Rank past command/reply pairs against ``query`` (bm25 via FTS5, LIKE otherwise)."""
+        terms = [t for t in query.split() if t]
+        if not terms:
+            return []
+        cur = self._reader().cursor()
+        if self._fts:
+            # Quote every term so user input is never parsed as FTS syntax.
+            match = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+            cur.execute(
+                "SELECT e.id, e.timestamp, e.session, e.command, e.reply, bm25(exchanges_fts) AS score "
+                "FROM exchanges_fts JOIN exchanges e ON e.id = exchanges_fts.rowid "
+                "WHERE exchanges_fts MATCH ? ORDER BY score LIMIT ?",
+                (match, limit),
+            )
+        else:
+            clauses = " AND ".join("(command LIKE ? OR reply LIKE ?)" for _ in terms)
+            params: List[Any] = []
+            for term in terms:
+                params.extend([f"%{term}%", f"%{term}%"])
+            cur.execute(
+                "SELECT id, timestamp, session, command, reply, 0.0 FROM exchanges WHERE "
+                + clauses
+                + " ORDER BY id DESC LIMIT ?",
+                params + [limit],
+            )
+        return [
+            {
+                "id": row[0],
+                "timestamp": row[1],
+                "session": row[2],
+                "command": row[3],
+                "reply": row[4],
+                "score": round(-row[5], 4),
+            }
+            for row in cur.fetchall()
+        ]
+
+    def flush(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._writer.queue.join()
+
+    def writer_stats(self) -> dict:
+        if self._writer is None:
+            return {"async": False}
+        return {
+            "async": True,
+            "queued": self._writer.queue.qsize(),
+            "batches": self._writer.batches,
+            "written": self._writer.written,
+        }
+
+    def add_vector(self, kind: str, ref: Optional[str], text: str, vector: bytes, dim: int) -> int:
+        with self._writing() as conn:
+            cur = conn.execute(
+                "INSERT INTO vectors (kind, ref, text, dim, vector, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, ref, text, dim, vector, time.time()),
+            )
+            return int(cur.lastrowid)
+
+    def delete_pack_vectors(self, name: str, keep: Iterable[str] = ()) -> List[int]:
+        """Delete stored chunks of pack ``name`` whose ref is not in ``keep``; return their ids."""
+        prefix = f"pack:{name}:"
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        kept = set(keep)
+        with self._writing() as conn:
+            rows = conn.execute(
+                "SELECT id, ref FROM vectors WHERE ref LIKE ? ESCAPE '\\'", (escaped + "%",)
+            ).fetchall()
+            # LIKE also matches packs whose name merely starts with "<name>:".
+            stale = [row_id for row_id, ref in rows if ref.rsplit(":", 1)[0] == prefix[:-1] and ref not in kept]
+            conn.executemany("DELETE FROM vectors WHERE id = ?", [(row_id,) for row_id in stale])
+        return stale
+
+    def iter_vectors(self, page_size: int = 1000) -> Iterator[Tuple[int, str, Optional[str], str, int, bytes]]:
+        after_id = 0
+        cur = self._reader().cursor()
+        while True:
+            cur.execute(
+                "SELECT id, kind, ref, text, dim, vector FROM vectors WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, page_size),
+            )
+            rows = cur.fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][0]
+
+    def events_page(
+        self,
+        event_type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        after_id: int = 0,
+        limit: int = 500,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return one page of events plus the cursor for the next page (None at the end)."""
+        cur = self._reader().cursor()
+        cur.execute(*_events_query(event_type, since, until, after_id, limit))
+        rows = [
+            {"id": row[0], "timestamp": row[1], "event_type": row[2], "payload": row[3]}
+            for row in cur.fetchall()
+        ]
+        cursor = rows[-1]["id"] if len(rows) == limit else None
+        return rows, cursor
+
+    def iter_events(
+        self,
+        event_type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream matching events in id order, one keyset page at a time."""
+        after_id = 0
+        while True:
+            rows, cursor = self.events_page(event_type, since, until, after_id, page_size)
+            yield from rows
+            if cursor is None:
+                return
+            after_id = cursor
+
+    def compact_events(self, older_than: float, archive_dir: Optional[str] = None, batch_size: int = 5000) -> int:
+        """Delete events older than ``older_than``, archiving them first when ``archive_dir`` is set.
+
+        Archived rows are appended to gzip-compressed JSONL files, one per
+        calendar month, so old history stays queryable offline.
+        """
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        removed = 0
+        while True:
+            with self._write_lock:
+                rows = self._conn.execute(
+                    "SELECT id, timestamp, event_type, payload FROM events WHERE timestamp < ? ORDER BY id LIMIT ?",
+                    (older_than, batch_size),
+                ).fetchall()
+                if not rows:
+                    return removed
+                if archive_dir:
+                    self._archive_rows(rows, archive_dir)
+                with self._writing() as conn:
+                    conn.executemany("DELETE FROM events WHERE id = ?", [(row[0],) for row in rows])
+            removed += len(rows)
+
+    def _archive_rows(self, rows: List[Tuple[int, float, str, str]], archive_dir: str) -> None:
+        by_month: Dict[str, List[str]] = {}
+        for row_id, timestamp, event_type, payload in rows:
+            month = time.strftime("%Y-%m", time.gmtime(timestamp))
+            record = {"id": row_id, "timestamp": timestamp, "event_type": event_type, "payload": payload}
+            by_month.setdefault(month, []).append(json.dumps(record))
+        for month, lines in by_month.items():
+            path = os.path.join(archive_dir, f"events-{month}.jsonl.gz")
+            with gzip.open(path, "at", encoding="utf-8") as handle:
+                handle.write("\n".join(lines) + "\n")
+
+    def start_retention(
+        self,
+        max_age: float,
+        archive_dir: Optional[str] = None,
+        interval: float = 3600.0,
+        session_max_age: float = 0.0,
+    ) -> None:
+        if self._retention is not None or (max_age <= 0 and session_max_age <= 0):
+            return
+
+        def _loop() -> None:
+            while not self._retention_stop.is_set():
+                if max_age > 0:
+                    try:
+                        removed = self.compact_events(time.time() - max_age, archive_dir)
+                        if removed:
+                            logging.info("compacted %s events", removed)
+                    except Exception:
+                        logging.exception("event_compaction_failed")
+                if session_max_age > 0:
+                    try:
+                        removed = self.prune_sessions(time.time() - session_max_age)
+                        if removed:
+                            logging.info("pruned %s idle sessions", removed)
+                    except Exception:
+                        logging.exception("session_prune_failed")
+                self._retention_stop.wait(interval)
+
+        self._retention = threading.Thread(target=_loop, name="jarvis-event-retention", daemon=True)
+        self._retention.start()
+
+    def close(self) -> None:
+        self._retention_stop.set()
+        if self._retention is not None:
+            self._retention.join()
+        if self._writer is not None and self._writer.is_alive():
+            self._writer.queue.put(_STOP)
+            self._writer.join()
+        with self._readers_lock:
+            for _, conn in self._readers.values():
+                conn.close()
+            self._readers.clear()
+        with self._write_lock:
+            self._conn.close()
+
+    def get_response(self, key: str) -> Optional[Tuple[str, float]]:
+        cur = self._reader().cursor()
+        cur.execute("SELECT value, created_at FROM response_cache WHERE key=?", (key,))
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put_response(self, key: str, value: str) -> None:
+        with self._writing() as conn:
+            conn.execute(
+                "INSERT INTO response_cache (key, value, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value, created_at=excluded.created_at",
+                (key, value, time.time()),
+            )
+
+    def prune_responses(self, older_than: float) -> int:
+        with self._writing() as conn:
+            cur = conn.execute("DELETE FROM response_cache WHERE created_at < ?", (older_than,))
+            return cur.rowcount
+
+    def clear_responses(self) -> int:
+        with self._writing() as conn:
+            return conn.execute("DELETE FROM response_cache").rowcount
+
+    def get_session(self, session_id: str) -> Optional[Tuple[str, str]]:
+        cur = self._reader().cursor()
+        cur.execute("SELECT model, context FROM sessions WHERE session_id=?", (session_id,))
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_session(self, session_id: str, model: str, context: str) -> None:
+        with self._writing() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, model, context, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET model=excluded.model, context=excluded.context, "
+                "updated_at=excluded.updated_at",
+                (session_id, model, context, time.time()),
+            )
+
+    def delete_session(self, session_id: str) -> None:
+        with self._writing() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id=?", (session_id,))
+
+    def prune_sessions(self, older_than: float) -> int:
+        with self._writing() as conn:
+            cur = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (older_than,))
+            return cur.rowcount
@@ -1,8 +1,19 @@
 ﻿from __future__ import annotations
 
+import hashlib
+import http.client
+import json
+import logging
 import socket
 import subprocess
+import threading
 import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .config import Settings
+from .limiter import AdaptiveLimiter
+from .singleflight import SingleFlight
 
 
 def is_port_open(host: str, port: int, timeout: float = 0.5) -> bool:
@@ -33,3 +44,489 @@ def ensure_ollama_running(host: str = "127.0.0.1", port: int = 11434) -> None:
         if is_port_open(host, port):
             return
         time.sleep(0.25)
+
+
+class OllamaError(Exception):
+    pass
+
+
+def parse_base(base: str) -> Tuple[str, int]:
+    parsed = urlparse(base if "://" in base else f"http://{base}")
+    return parsed.hostname or "127.0.0.1", parsed.port or 11434
+
+
+def _seconds(out: Dict[str, Any], *fields: str) -> float:
+    # Ollama reports its timings in nanoseconds.
+    return sum(out.get(name) or 0 for name in fields) / 1e9
+
+
+class OllamaClient:
+    """Ollama HTTP client that keeps a small pool of HTTP/1.1 keep-alive connections."""
+
+    def __init__(
+        self,
+        base: str,
+        timeout: float = 120.0,
+        connect_timeout: float = 5.0,
+        pool_size: int = 4,
+        coalesce: bool = True,
+        keep_alive: Optional[str] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        aux_limiter: Optional[AdaptiveLimiter] = None,
+    ) -> None:
+        self.base = base
+        self.keep_alive = keep_alive
+        self.host, self.port = parse_base(base)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        # Identical concurrent requests share one upstream generation.
+        self.flight: Optional[SingleFlight] = SingleFlight() if coalesce else None
+        self.limiter = limiter
+        # Embeddings and model loads get their own lane, so a lookup made before
+        # every command does not queue behind long generations.
+        self.aux_limiter = aux_limiter
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        **extra: Any,
+    ) -> Dict[str, Any]:
+        payload = self._payload(model, options, extra, prompt=prompt, stream=False)
+        return self._coalesced("/api/generate", payload, timeout)
+
+    def generate_stream(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        **extra: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        payload = self._payload(model, options, extra, prompt=prompt, stream=True)
+        return self._coalesced_stream("/api/generate", payload, timeout)
+
+    def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        **extra: Any,
+    ) -> Dict[str, Any]:
+        payload = self._payload(model, options, extra, messages=messages, stream=False)
+        return self._coalesced("/api/chat", payload, timeout)
+
+    def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        **extra: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        payload = self._payload(model, options, extra, messages=messages, stream=True)
+        return self._coalesced_stream("/api/chat", payload, timeout)
+
+    def embeddings(self, model: str, prompt: str, timeout: Optional[float] = None) -> List[float]:
+        payload = self._payload(model, None, {}, prompt=prompt)
+        out = self._limited_request("/api/embeddings", payload, timeout, self.aux_limiter)
+        return out.get("embedding", [])
+
+    def load(self, model: str, timeout: Optional[float] = None, options: Optional[Dict[str, Any]] = None) -> None:
+        # A generate call without a prompt only loads the model into memory.
+        payload = self._payload(model, options, {}, stream=False)
+        self._limited_request("/api/generate", payload, timeout, self.aux_limiter)
+
+    def ps(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        out = self._request("GET", "/api/ps", None, timeout)
+        return out.get("models", [])
+
+    def tags(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        out = self._request("GET", "/api/tags", None, timeout)
+        return out.get("models", [])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"idle_connections": len(self._idle)}
+        if self.flight is not None:
+            out["singleflight"] = self.flight.stats()
+        if self.limiter is not None:
+            out["limiter"] = self.limiter.stats()
+        if self.aux_limiter is not None:
+            out["aux_limiter"] = self.aux_limiter.stats()
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _payload(
+        self, model: str, options: Optional[Dict[str, Any]], extra: Dict[str, Any], **fields: Any
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, **fields}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        return payload
+
+    def _flight_key(self, path: str, payload: Dict[str, Any]) -> str:
+        raw = json.dumps([path, payload], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _coalesced(self, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        if self.flight is None:
+            return self._limited_request(path, payload, timeout, self.limiter)
+        key = self._flight_key(path, payload)
+        return self.flight.do(key, lambda: self._limited_request(path, payload, timeout, self.limiter))
+
+    def _coalesced_stream(
+        self, path: str, payload: Dict[str, Any], timeout: Optional[float]
+    ) -> Iterator[Dict[str, Any]]:
+        if self.flight is None:
+            return self._limited_stream(path, payload, timeout)
+        key = self._flight_key(path, payload)
+        return self.flight.stream(key, lambda: self._limited_stream(path, payload, timeout))
+
+    def _limited_request(
+        self, path: str, payload: Dict[str, Any], timeout: Optional[float], limiter: Optional[AdaptiveLimiter]
+    ) -> Dict[str, Any]:
+        if limiter is None:
+            return self._request("POST", path, payload, timeout)
+        with limiter.slot() as slot:
+            out = self._request("POST", path, payload, timeout)
+            # Only the wait before output began reflects load; long answers and cold loads do not.
+            slot.latency = time.monotonic() - slot.started - _seconds(out, "load_duration", "eval_duration")
+            return out
+
+    def _limited_stream(
+        self, path: str, payload: Dict[str, Any], timeout: Optional[float]
+    ) -> Iterator[Dict[str, Any]]:
+        if self.limiter is None:
+            yield from self._stream(path, payload, timeout)
+            return
+        # The slot is held for the whole generation, but only the time to the
+        # first chunk, less any model load, counts as latency.
+        with self.limiter.slot() as slot:
+            for chunk in self._stream(path, payload, timeout):
+                if slot.latency is None:
+                    slot.latency = time.monotonic() - slot.started
+                if chunk.get("done"):
+                    slot.latency -= _seconds(chunk, "load_duration")
+                yield chunk
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        return conn, False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _send(
+        self, method: str, path: str, payload: Optional[Dict[str, Any]], timeout: Optional[float]
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            conn, reused = self._acquire()
+            try:
+                conn.sock.settimeout(timeout if timeout is not None else self.timeout)
+                conn.request(method, path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                # A pooled socket may have been closed by the server while idle.
+                if not reused or attempt:
+                    raise
+            except Exception:
+                conn.close()
+                raise
+        raise OllamaError("unreachable")
+
+    def _request(
+        self, method: str, path: str, payload: Optional[Dict[str, Any]], timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        conn, resp = self._send(method, path, payload, timeout)
+        try:
+            raw = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        out = json.loads(raw.decode("utf-8", errors="ignore") or "{}")
+        if resp.status != 200 or out.get("error"):
+            raise OllamaError(out.get("error") or f"HTTP {resp.status}")
+        return out
+
+    def _stream(
+        self, path: str, payload: Dict[str, Any], timeout: Optional[float]
+    ) -> Iterator[Dict[str, Any]]:
+        conn, resp = self._send("POST", path, payload, timeout)
+        finished = False
+        try:
+            if resp.status != 200:
+                raw = resp.read().decode("utf-8", errors="ignore")
+                try:
+                    message = json.loads(raw).get("error") or raw
+                except ValueError:
+                    message = raw
+                raise OllamaError(message or f"HTTP {resp.status}")
+            for line in resp:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line.decode("utf-8", errors="ignore"))
+                if chunk.get("error"):
+                    raise OllamaError(chunk["error"])
+                yield chunk
+                if chunk.get("done"):
+                    break
+            resp.read()
+            finished = True
+        finally:
+            # Closing mid-stream drops the connection, which makes Ollama stop generating.
+            if finished and not resp.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+
+class ModelInventory:
+    """Cached /api/tags listing so model selection never waits on HTTP."""
+
+    def __init__(self, client: OllamaClient, ttl: float = 60.0) -> None:
+        self.client = client
+        self.ttl = ttl
+        self._models: List[str] = []
+        self._loaded = False
+        self._fetched_at = 0.0
+        self._error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stop = threading.Event()
+
+    def models(self) -> List[str]:
+        if not self._loaded:
+            # Only the very first lookup blocks; later ones are served from memory.
+            return self.refresh()
+        if time.monotonic() - self._fetched_at > self.ttl:
+            self.refresh_async()
+        with self._lock:
+            return list(self._models)
+
+    def refresh(self) -> List[str]:
+        try:
+            names = [m.get("name") for m in self.client.tags(timeout=2.0) if m.get("name")]
+        except Exception as exc:
+            with self._lock:
+                self._error = str(exc)
+                self._loaded = True
+                self._fetched_at = time.monotonic()
+                return list(self._models)
+        with self._lock:
+            self._models = names
+            self._error = None
+            self._loaded = True
+            self._fetched_at = time.monotonic()
+            return list(names)
+
+    def refresh_async(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_once, name="jarvis-inventory", daemon=True).start()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fetched_at = 0.0
+        self.refresh_async()
+
+    def start(self) -> None:
+        threading.Thread(target=self._refresh_loop, name="jarvis-inventory-loop", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            age = round(time.monotonic() - self._fetched_at, 1) if self._loaded and self._fetched_at else None
+            return {"models": list(self._models), "age_seconds": age, "error": self._error}
+
+    def _refresh_once(self) -> None:
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.ttl)
+
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(settings: Settings) -> OllamaClient:
+    with _clients_lock:
+        client = _clients.get(settings.ollama_base)
+        if client is None:
+            client = OllamaClient(
+                settings.ollama_base,
+                timeout=settings.ollama_timeout,
+                connect_timeout=settings.ollama_connect_timeout,
+                keep_alive=settings.ollama_keep_alive or None,
+                limiter=AdaptiveLimiter(
+                    initial=min(2, settings.ollama_max_concurrency),
+                    max_limit=settings.ollama_max_concurrency,
+                    max_queue=settings.ollama_queue_size,
+                    queue_timeout=settings.ollama_queue_timeout,
+                ),
+                aux_limiter=AdaptiveLimiter(
+                    initial=min(2, settings.ollama_max_concurrency),
+                    max_limit=settings.ollama_max_concurrency,
+                    max_queue=settings.ollama_queue_size,
+                    queue_timeout=settings.ollama_queue_timeout,
+                ),
+            )
+            _clients[settings.ollama_base] = client
+        return client
+
+
+_inventories: Dict[str, ModelInventory] = {}
+
+
+def get_inventory(settings: Settings) -> ModelInventory:
+    client = get_client(settings)
+    with _clients_lock:
+        inventory = _inventories.get(settings.ollama_base)
+        if inventory is None:
+            inventory = ModelInventory(client, ttl=settings.ollama_inventory_ttl)
+            _inventories[settings.ollama_base] = inventory
+        return inventory
+
+
+def model_name(name: str) -> str:
+    # Settings use litellm-style names such as "ollama/llama3.2-vision".
+    for prefix in ("ollama_chat/", "ollama/"):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+class ModelWarmer:
+    """Preload models in the background so the first command skips the load.
+
+    Residency from /api/ps is cached and refreshed off the request path,
+    like ModelInventory, so ``info`` polls never wait on HTTP.
+    """
+
+    def __init__(
+        self,
+        client: OllamaClient,
+        models: List[str],
+        ttl: float = 10.0,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.client = client
+        self.models = list(dict.fromkeys(m for m in models if m))
+        # Load with the options later requests use; a different num_ctx makes Ollama reload the model.
+        self.options = options
+        self.status: Dict[str, str] = {m: "pending" for m in self.models}
+        self.ttl = ttl
+        self._thread: Optional[threading.Thread] = None
+        self._resident: Dict[str, Any] = {}
+        self._ps_error: Optional[str] = None
+        self._ps_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="jarvis-warmup", daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        for model in self.models:
+            self.status[model] = "loading"
+            started = time.monotonic()
+            try:
+                self.client.load(model, options=self.options)
+            except Exception as exc:
+                logging.warning("warmup failed for %s: %s", model, exc)
+                self.status[model] = f"error: {exc}"
+                continue
+            logging.info("warmed %s in %.1fs", model, time.monotonic() - started)
+            self.status[model] = "ready"
+        self.refresh_residency()
+
+    def residency(self) -> Dict[str, Any]:
+        if time.monotonic() - self._ps_at > self.ttl:
+            self.refresh_residency_async()
+        with self._lock:
+            age = round(time.monotonic() - self._ps_at, 1) if self._ps_at else None
+            out: Dict[str, Any] = {
+                "warmup": dict(self.status),
+                "resident": dict(self._resident),
+                "keep_alive": self.client.keep_alive,
+                "age_seconds": age,
+            }
+            if self._ps_error is not None:
+                out["error"] = self._ps_error
+            return out
+
+    def refresh_residency(self, timeout: float = 1.0) -> None:
+        try:
+            loaded = {m.get("name", ""): m for m in self.client.ps(timeout=timeout)}
+        except Exception as exc:
+            with self._lock:
+                self._ps_error = str(exc)
+                self._ps_at = time.monotonic()
+            return
+        resident = {
+            name: {"expires_at": info.get("expires_at"), "size_vram": info.get("size_vram")}
+            for name, info in loaded.items()
+        }
+        with self._lock:
+            self._resident = resident
+            self._ps_error = None
+            self._ps_at = time.monotonic()
+
+    def refresh_residency_async(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_once, name="jarvis-residency", daemon=True).start()
+
+    def _refresh_once(self) -> None:
+        try:
+            self.refresh_residency()
+        finally:
+            with self._lock:
+                self._refreshing = False
@@ -1,26 +1,47 @@
 from __future__ import annotations
 
 import json
+import logging
 import os
 import subprocess
-from dataclasses import dataclass
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Sequence
 
 from openai import OpenAI
 
 from . import desktop
+from .context import truncate_tokens
+from .listing import Listing, walk_files
+from .tokens import token_counter
+from .tool_cache import MUTATING_TOOLS, ToolResultCache
 
 def _safe_path(path: str) -> Path:
     return Path(path).expanduser().resolve()
 
 
-def list_files(path: str = ".", pattern: str = "*", limit: int = 200) -> list[str]:
+def list_files(
+    path: str = ".",
+    pattern: str = "*",
+    limit: int = 200,
+    include_stats: bool = False,
+    include_ignored: bool = False,
+) -> list:
     base = _safe_path(path)
-    if not base.exists():
-        return []
-    results = [str(p) for p in base.rglob(pattern) if p.is_file()]
-    return results[:limit]
+    results = Listing()
+    if not base.exists() or limit <= 0:
+        return results
+    for entry in walk_files(str(base), pattern, include_ignored, visited=results.dirs):
+        if include_stats:
+            stat = entry.stat()
+            results.append({"path": entry.path, "size": stat.st_size, "mtime": stat.st_mtime})
+        else:
+            results.append(entry.path)
+        if len(results) >= limit:
+            break
+    return results
 
 
 def read_file(path: str, max_bytes: int = 200_000) -> str:
@@ -72,13 +93,18 @@ TOOLS: list[dict[str, Any]] = [
     {
         "type": "function",
         "name": "list_files",
-        "description": "List files recursively under a path.",
+        "description": (
+            "List files recursively under a path, nearest first. Skips .git, node_modules, "
+            "virtualenvs and .gitignore'd paths unless include_ignored is true."
+        ),
         "parameters": {
             "type": "object",
             "properties": {
                 "path": {"type": "string"},
                 "pattern": {"type": "string"},
                 "limit": {"type": "integer"},
+                "include_stats": {"type": "boolean", "description": "Return size and mtime per file."},
+                "include_ignored": {"type": "boolean"},
             },
         },
         "strict": False,
@@ -285,6 +311,65 @@ _TOOL_MAP = {
     "focus_window": desktop.focus_window,
 }
 
+# Mouse, keyboard and screen tools drive one shared desktop, so they run one at
+# a time and in the order the model issued them, even across agents.
+_SERIAL_TOOLS = frozenset(
+    {
+        "screenshot",
+        "get_screen_size",
+        "mouse_move",
+        "mouse_click",
+        "mouse_drag",
+        "scroll",
+        "type_text",
+        "key_press",
+        "hotkey",
+        "list_windows",
+        "get_active_window",
+        "focus_window",
+    }
+)
+_DESKTOP_LOCK = threading.RLock()
+
+
+def _field(obj: Any, name: str, default: Any = None) -> Any:
+    # SDK events are objects, but tests and fakes often hand back plain dicts.
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _execute_tool(call: dict[str, Any], model: str = "", cache: ToolResultCache | None = None) -> dict[str, Any]:
+    name = call.get("name")
+    args_raw = call.get("arguments", "{}")
+    try:
+        args = json.loads(args_raw)
+    except Exception:
+        args = {}
+    fn = _TOOL_MAP.get(name)
+    result: Any = f"error: unknown tool {name}"
+    if fn:
+        try:
+            if name in _SERIAL_TOOLS:
+                with _DESKTOP_LOCK:
+                    result = fn(**args)
+            elif cache is not None:
+                result = cache.call(name, args, lambda: fn(**args))
+            else:
+                result = fn(**args)
+        except Exception as exc:
+            result = f"error: {exc}"
+    return _tool_output(call, result, model)
+
+
+def _tool_output(call: dict[str, Any], result: Any, model: str = "") -> dict[str, Any]:
+    output = json.dumps(result) if not isinstance(result, str) else result
+    # Large listings or logs would otherwise be re-sent on every later turn.
+    limit = int(os.getenv("JARVIS_TOOL_OUTPUT_TOKENS", "4000"))
+    if limit > 0:
+        output = truncate_tokens(output, limit, token_counter(model), keep="middle")
+    return {"type": "function_call_output", "call_id": call.get("call_id"), "output": output}
+
 
 @dataclass
 class OpenAIAgent:
@@ -293,42 +378,113 @@ class OpenAIAgent:
         "You are Jarvis, a world-class autonomous software engineer. "
         "Use tools when needed. Always verify changes before finalizing."
     )
+    max_tool_workers: int = int(os.getenv("JARVIS_TOOL_CONCURRENCY", "4"))
+    _tool_pool: ThreadPoolExecutor | None = field(default=None, init=False, repr=False)
+    _desktop_lane: ThreadPoolExecutor | None = field(default=None, init=False, repr=False)
+    # The runner shares one agent across threads, so the executors are created under a lock.
+    _executors_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    last_run_stats: dict[str, int] = field(default_factory=dict, init=False)
 
     def __post_init__(self) -> None:
         self.client = OpenAI()
 
-    def _call_tools(self, tool_calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        outputs = []
+    def close(self) -> None:
+        with self._executors_lock:
+            pool, self._tool_pool = self._tool_pool, None
+            lane, self._desktop_lane = self._desktop_lane, None
+        for executor in (pool, lane):
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executors_lock:
+            if self._tool_pool is None:
+                self._tool_pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.max_tool_workers), thread_name_prefix="jarvis-tool"
+                )
+            return self._tool_pool
+
+    def _lane(self) -> ThreadPoolExecutor:
+        # A one-thread lane keeps desktop calls in the order they were streamed.
+        with self._executors_lock:
+            if self._desktop_lane is None:
+                self._desktop_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jarvis-desktop")
+            return self._desktop_lane
+
+    def _call_tools(
+        self, tool_calls: list[dict[str, Any]], cache: ToolResultCache | None = None
+    ) -> list[dict[str, Any]]:
+        if len(tool_calls) < 2 or self.max_tool_workers <= 1:
+            return [self._call_tool(call, cache) for call in tool_calls]
+        # A write or command can change what reads see, so it runs alone: after
+        # every call before it and before any call after it.
+        outputs: list[dict[str, Any]] = []
+        batch: list[dict[str, Any]] = []
         for call in tool_calls:
-            name = call.get("name")
-            args_raw = call.get("arguments", "{}")
-            try:
-                args = json.loads(args_raw)
-            except Exception:
-                args = {}
-            fn = _TOOL_MAP.get(name)
-            result = f"error: unknown tool {name}"
-            if fn:
-                try:
-                    result = fn(**args)
-                except Exception as exc:
-                    result = f"error: {exc}"
-            outputs.append(
-                {
-                    "type": "function_call_output",
-                    "call_id": call.get("call_id"),
-                    "output": json.dumps(result) if not isinstance(result, str) else result,
-                }
-            )
+            if call.get("name") in MUTATING_TOOLS:
+                outputs.extend(self._call_batch(batch, cache))
+                outputs.append(self._call_tool(call, cache))
+                batch = []
+            else:
+                batch.append(call)
+        outputs.extend(self._call_batch(batch, cache))
         return outputs
 
+    def _call_batch(
+        self, tool_calls: list[dict[str, Any]], cache: ToolResultCache | None = None
+    ) -> list[dict[str, Any]]:
+        if len(tool_calls) < 2:
+            return [self._call_tool(call, cache) for call in tool_calls]
+        outputs: list[dict[str, Any] | None] = [None] * len(tool_calls)
+        serial = [i for i, call in enumerate(tool_calls) if call.get("name") in _SERIAL_TOOLS]
+
+        def _run(index: int) -> None:
+            outputs[index] = self._call_tool(tool_calls[index], cache)
+
+        def _run_serial() -> None:
+            with _DESKTOP_LOCK:
+                for index in serial:
+                    _run(index)
+
+        pool = self._pool()
+        futures = [pool.submit(_run, i) for i in range(len(tool_calls)) if i not in serial]
+        if serial:
+            futures.append(pool.submit(_run_serial))
+        for future in futures:
+            future.result()
+        # Outputs keep the order of the calls, whatever order they finished in.
+        return [output for output in outputs if output is not None]
+
+    def _submit_tool(
+        self, call: dict[str, Any], cache: ToolResultCache | None = None, after: Sequence[Future] = ()
+    ) -> Future:
+        """Start ``call`` once every future in ``after`` has finished."""
+
+        def _run() -> dict[str, Any]:
+            # Only earlier submissions are ever waited on, so this cannot deadlock the pool.
+            wait(after)
+            return self._call_tool(call, cache)
+
+        executor = self._lane() if call.get("name") in _SERIAL_TOOLS else self._pool()
+        return executor.submit(_run)
+
+    def _call_tool(self, call: dict[str, Any], cache: ToolResultCache | None = None) -> dict[str, Any]:
+        return _execute_tool(call, self.model, cache)
+
+    def _finish_run(self, cache: ToolResultCache) -> None:
+        self.last_run_stats = cache.stats()
+        if self.last_run_stats["tool_calls"]:
+            logging.info("agent run tools: %s", self.last_run_stats)
+
     def run(self, prompt: str) -> str:
+        cache = ToolResultCache()
         response = self.client.responses.create(
             model=self.model,
             instructions=self.instructions,
             input=[{"role": "user", "content": prompt}],
             tools=TOOLS,
             tool_choice="auto",
+            truncation="auto",
         )
         final_text = ""
         tool_calls: list[dict[str, Any]] = []
@@ -341,7 +497,7 @@ class OpenAIAgent:
                 tool_calls.append(item)
 
         while tool_calls:
-            tool_outputs = self._call_tools(tool_calls)
+            tool_outputs = self._call_tools(tool_calls, cache)
             response = self.client.responses.create(
                 model=self.model,
                 instructions=self.instructions,
@@ -349,6 +505,7 @@ class OpenAIAgent:
                 previous_response_id=response.id,
                 tools=TOOLS,
                 tool_choice="auto",
+                truncation="auto",
             )
             tool_calls = []
             for item in response.output:
@@ -359,6 +516,7 @@ class OpenAIAgent:
                 if item.get("type") == "function_call":
                     tool_calls.append(item)
 
+        self._finish_run(cache)
         return final_text.strip()
 
     def run_agentic(self, prompt: str) -> str:
@@ -366,18 +524,22 @@ class OpenAIAgent:
         builder = "You are the Builder. Execute the plan using tools."
         reviewer = "You are the Reviewer. Verify outputs and list risks/tests."
 
-        plan = self._run_with_tools(prompt, planner)
-        build = self._run_with_tools(f"Plan:\n{plan}\n\nTask:\n{prompt}", builder)
-        review = self._run_with_tools(f"Plan:\n{plan}\n\nBuild Output:\n{build}", reviewer)
+        # One cache spans all three roles, which tend to re-read the same files.
+        cache = ToolResultCache()
+        plan = self._run_with_tools(prompt, planner, cache)
+        build = self._run_with_tools(f"Plan:\n{plan}\n\nTask:\n{prompt}", builder, cache)
+        review = self._run_with_tools(f"Plan:\n{plan}\n\nBuild Output:\n{build}", reviewer, cache)
+        self._finish_run(cache)
         return f"PLAN:\n{plan}\n\nBUILD:\n{build}\n\nREVIEW:\n{review}".strip()
 
-    def _run_with_tools(self, prompt: str, instructions: str) -> str:
+    def _run_with_tools(self, prompt: str, instructions: str, cache: ToolResultCache | None = None) -> str:
         response = self.client.responses.create(
             model=self.model,
             instructions=instructions,
             input=[{"role": "user", "content": prompt}],
             tools=TOOLS,
             tool_choice="auto",
+            truncation="auto",
         )
         final_text = ""
         tool_calls: list[dict[str, Any]] = []
@@ -390,7 +552,7 @@ class OpenAIAgent:
                 tool_calls.append(item)
 
         while tool_calls:
-            tool_outputs = self._call_tools(tool_calls)
+            tool_outputs = self._call_tools(tool_calls, cache)
             response = self.client.responses.create(
                 model=self.model,
                 instructions=instructions,
@@ -398,6 +560,7 @@ class OpenAIAgent:
                 previous_response_id=response.id,
                 tools=TOOLS,
                 tool_choice="auto",
+                truncation="auto",
             )
             tool_calls = []
             for item in response.output:
@@ -409,3 +572,67 @@ class OpenAIAgent:
                     tool_calls.append(item)
 
         return final_text.strip()
+
+    def stream(self, prompt: str, instructions: str | None = None) -> Iterator[dict[str, Any]]:
+        """Run the tool loop with streaming, yielding events as they arrive.
+
+        Events are ``{"type": "text", "delta"}``, ``{"type": "tool_call", "name",
+        "call_id", "arguments"}``, ``{"type": "tool_result", "call_id", "output"}``
+        and a final ``{"type": "done", "text", "stats"}``. Each tool starts as soon as its
+        arguments are complete, while the model is still streaming the rest.
+        """
+        instructions = instructions or self.instructions
+        cache = ToolResultCache()
+        final_text = ""
+        request: dict[str, Any] = {"input": [{"role": "user", "content": prompt}]}
+        while True:
+            pending: list[tuple[dict[str, Any], Future]] = []
+            barrier: list[Future] = []
+            response_id = None
+            events = self.client.responses.create(
+                model=self.model,
+                instructions=instructions,
+                tools=TOOLS,
+                tool_choice="auto",
+                truncation="auto",
+                stream=True,
+                **request,
+            )
+            for event in events:
+                kind = _field(event, "type")
+                if kind == "response.output_text.delta":
+                    delta = _field(event, "delta", "")
+                    final_text += delta
+                    yield {"type": "text", "delta": delta}
+                elif kind == "response.output_item.done":
+                    item = _field(event, "item")
+                    if _field(item, "type") != "function_call":
+                        continue
+                    call = {
+                        "name": _field(item, "name"),
+                        "call_id": _field(item, "call_id"),
+                        "arguments": _field(item, "arguments", "{}"),
+                    }
+                    if call["name"] in MUTATING_TOOLS:
+                        # Same barrier as _call_tools: after all earlier calls, before all later ones.
+                        future = self._submit_tool(call, cache, after=[f for _, f in pending])
+                        barrier = [future]
+                    else:
+                        future = self._submit_tool(call, cache, after=barrier)
+                    pending.append((call, future))
+                    yield {"type": "tool_call", **call}
+                elif kind == "response.completed":
+                    response_id = _field(_field(event, "response"), "id")
+                elif kind in ("response.failed", "error"):
+                    error = _field(_field(event, "response"), "error") or _field(event, "message")
+                    raise RuntimeError(f"response failed: {error}")
+            if not pending:
+                break
+            outputs = []
+            for call, future in pending:
+                output = future.result()
+                outputs.append(output)
+                yield {"type": "tool_result", "call_id": call["call_id"], "output": output["output"]}
+            request = {"input": outputs, "previous_response_id": response_id}
+        self._finish_run(cache)
+        yield {"type": "done", "text": final_text.strip(), "stats": self.last_run_stats}
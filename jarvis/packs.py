@@ -1,3 +1,13 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+from typing import Callable
+
 PACKS = {
     "legal_ai_toolkit": (
         "Core Legal AI Toolkits:\n"
@@ -49,3 +59,202 @@ PACKS = {
         "- Accessibility and design consistency checks as standard.\n"
     ),
 }
+
+
+def chunk_text(text: str, max_chars: int = 400) -> list[str]:
+    """Split text on line boundaries into chunks of at most ``max_chars``.
+
+    The first line of a pack is its heading, so it is repeated on every
+    chunk to keep chunks self-describing once separated.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return []
+    heading, body = lines[0], lines[1:]
+    if not body:
+        return [heading]
+    chunks: list[str] = []
+    current: list[str] = []
+    size = len(heading)
+    for line in body:
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join([heading] + current))
+            current, size = [], len(heading)
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join([heading] + current))
+    return chunks
+
+
+PACK_SUFFIXES = (".md", ".txt")
+
+
+class PackLibrary:
+    """Packs loaded lazily from a directory, layered over the built-in PACKS.
+
+    Files are only read when a pack is first requested. Chunk lists are
+    cached per file, keyed on (mtime, size), and also written to
+    ``<dir>/.index`` with a content hash, so a restart or a
+    touched-but-unchanged file does not re-chunk. Full text is never kept:
+    it is read on demand, and files larger than ``mmap_threshold`` are
+    decoded straight from an mmap.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        builtins: dict[str, str] | None = None,
+        chunk_chars: int = 400,
+        mmap_threshold: int = 1_000_000,
+    ) -> None:
+        self.directory = directory
+        self.builtins = dict(PACKS if builtins is None else builtins)
+        self.chunk_chars = chunk_chars
+        self.mmap_threshold = mmap_threshold
+        self.version = 0
+        self._lock = threading.RLock()
+        self._files: dict[str, tuple[str, int, int]] = {}
+        self._chunks: dict[str, tuple[tuple[int, int], list[str]]] = {}
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._scan()
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return sorted(set(self.builtins) | set(self._files))
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._files or name in self.builtins
+
+    def get(self, name: str) -> str | None:
+        with self._lock:
+            entry = self._files.get(name)
+            if entry is None:
+                return self.builtins.get(name)
+        return self._read(entry[0], entry[2])
+
+    def preview(self, name: str, max_bytes: int = 64_000) -> str | None:
+        """Leading text of a pack, reading at most ``max_bytes`` of the file."""
+        with self._lock:
+            entry = self._files.get(name)
+            if entry is None:
+                text = self.builtins.get(name)
+                return text if text is None or len(text) <= max_bytes else text[:max_bytes] + "\n...[truncated]"
+        text = self._read(entry[0], entry[2], max_bytes)
+        return text + "\n...[truncated]" if entry[2] > max_bytes else text
+
+    def chunks(self, name: str) -> list[str]:
+        with self._lock:
+            entry = self._files.get(name)
+            key = (entry[1], entry[2]) if entry else (0, 0)
+            cached = self._chunks.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        if entry is None:
+            text = self.builtins.get(name)
+            chunks = chunk_text(text, self.chunk_chars) if text else []
+        else:
+            chunks = self._load_chunks(name, entry[0], key)
+        with self._lock:
+            self._chunks[name] = (key, chunks)
+        return chunks
+
+    def all_chunks(self) -> dict[str, list[str]]:
+        return {name: self.chunks(name) for name in self.names()}
+
+    def refresh(self) -> set[str]:
+        """Rescan the directory and return the names of packs that changed."""
+        with self._lock:
+            before = dict(self._files)
+            self._scan()
+            changed = {
+                name
+                for name in set(before) | set(self._files)
+                if before.get(name) != self._files.get(name)
+            }
+            for name in changed:
+                self._chunks.pop(name, None)
+            if changed:
+                self.version += 1
+            return changed
+
+    def start_watching(self, interval: float, on_change: Callable[[set[str]], None]) -> None:
+        if self.directory is None or self._watcher is not None:
+            return
+
+        def _loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    changed = self.refresh()
+                    if changed:
+                        logging.info("packs changed: %s", ", ".join(sorted(changed)))
+                        on_change(changed)
+                except Exception:
+                    logging.exception("pack_reload_failed")
+
+        self._watcher = threading.Thread(target=_loop, name="jarvis-pack-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    def _scan(self) -> None:
+        files: dict[str, tuple[str, int, int]] = {}
+        if self.directory and os.path.isdir(self.directory):
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.endswith(PACK_SUFFIXES):
+                        continue
+                    stat = entry.stat()
+                    files[os.path.splitext(entry.name)[0]] = (entry.path, stat.st_mtime_ns, stat.st_size)
+        self._files = files
+
+    def _read(self, path: str, size: int, limit: int | None = None) -> str:
+        with open(path, "rb") as handle:
+            if size >= self.mmap_threshold and (limit is None or limit >= self.mmap_threshold):
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    # Decoding from the buffer skips an intermediate bytes copy of the file.
+                    with memoryview(mapped) as view:
+                        return str(view[:limit], "utf-8", "ignore")
+            data = handle.read() if limit is None else handle.read(limit)
+            return data.decode("utf-8", errors="ignore")
+
+    def _index_path(self, name: str) -> str:
+        return os.path.join(self.directory or "", ".index", f"{name}.json")
+
+    def _load_chunks(self, name: str, path: str, key: tuple[int, int]) -> list[str]:
+        index_path = self._index_path(name)
+        stored = None
+        try:
+            with open(index_path, "r", encoding="utf-8") as handle:
+                stored = json.load(handle)
+        except (OSError, ValueError):
+            stored = None
+        if (
+            stored
+            and [stored.get("mtime_ns"), stored.get("size")] == list(key)
+            and stored.get("chunk_chars") == self.chunk_chars
+        ):
+            return stored["chunks"]
+        text = self.get(name) or ""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if stored and stored.get("sha1") == digest and stored.get("chunk_chars") == self.chunk_chars:
+            chunks = stored["chunks"]
+        else:
+            chunks = chunk_text(text, self.chunk_chars)
+        record = {
+            "mtime_ns": key[0],
+            "size": key[1],
+            "sha1": digest,
+            "chunk_chars": self.chunk_chars,
+            "chunks": chunks,
+        }
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with open(index_path, "w", encoding="utf-8") as handle:
+                json.dump(record, handle)
+        except OSError:
+            logging.warning("could not write pack index for %s", name)
+        return chunks
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .tokens import TokenCounter, token_counter
+
+PrefixKey = Tuple[str, Tuple[str, ...], str]
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    mode: str
+    packs: Tuple[str, ...]
+    backend: str
+    text: str
+    tokens: int
+
+
+class PromptCache:
+    """Compiled static prompt prefixes keyed on (mode, active packs, backend)."""
+
+    def __init__(
+        self,
+        build: Callable[[str, Tuple[str, ...], str], str],
+        max_entries: int = 64,
+        count_tokens: Optional[TokenCounter] = None,
+    ) -> None:
+        self.build = build
+        self.max_entries = max(1, max_entries)
+        self.count_tokens = count_tokens
+        self._entries: "OrderedDict[PrefixKey, PromptPrefix]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def prefix(self, mode: str, packs: Iterable[str], backend: str) -> PromptPrefix:
+        key: PrefixKey = (mode, tuple(packs), backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry
+            self._counters["misses"] += 1
+        text = self.build(*key)
+        count = self.count_tokens or token_counter(backend)
+        entry = PromptPrefix(mode=key[0], packs=key[1], backend=key[2], text=text, tokens=count(text))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, packs: Optional[Iterable[str]] = None) -> int:
+        """Drop every entry, or only those that include one of ``packs``."""
+        with self._lock:
+            if packs is None:
+                stale: List[PrefixKey] = list(self._entries)
+            else:
+                names = set(packs)
+                stale = [key for key in self._entries if names.intersection(key[1])]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._counters["invalidations"] += len(stale)
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [
+                {"mode": e.mode, "packs": list(e.packs), "backend": e.backend, "tokens": e.tokens}
+                for e in self._entries.values()
+            ]
+            return {**self._counters, "entries": entries}
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import itertools
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Union
+
+# Frames are a 4-byte big-endian length followed by a UTF-8 JSON object.
+# Capping the size below 16 MiB keeps the first header byte at zero, which is
+# how the server tells framed clients apart from legacy newline clients.
+_HEADER = struct.Struct(">I")
+MAX_FRAME = (1 << 24) - 1
+FRAME_MARKER = b"\x00"
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(payload: Dict[str, Any]) -> bytes:
+    body = json.dumps(payload).encode("utf-8")
+    if len(body) > MAX_FRAME:
+        raise ProtocolError(f"frame too large: {len(body)} bytes")
+    return _HEADER.pack(len(body)) + body
+
+
+def _read_exact(rfile: BinaryIO, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = rfile.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(rfile: BinaryIO) -> Optional[Dict[str, Any]]:
+    header = _read_exact(rfile, _HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ProtocolError("truncated frame header")
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ProtocolError(f"frame too large: {length} bytes")
+    body = _read_exact(rfile, length)
+    if len(body) < length:
+        raise ProtocolError("truncated frame body")
+    return json.loads(body.decode("utf-8"))
+
+
+class FramedClient:
+    """Long-lived connection that can pipeline several commands at once."""
+
+    def __init__(self, host: str, port: int, timeout: float = 2.0) -> None:
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        # Timeouts are enforced per request; the reader thread blocks freely.
+        self._sock.settimeout(None)
+        self._rfile = self._sock.makefile("rb")
+        self._write_lock = threading.Lock()
+        # Plain requests wait on a Future; streamed ones drain a queue of frames.
+        self._pending: Dict[int, Union[Future, "queue.Queue"]] = {}
+        self._pending_lock = threading.Lock()
+        # Pieces of split replies; only the reader thread touches this.
+        self._parts: Dict[int, list[str]] = {}
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_loop, name="jarvis-client-reader", daemon=True)
+        self._reader.start()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def submit(self, command: str, session: Optional[str] = None) -> Future:
+        future: Future = Future()
+        self._send(command, session, future)
+        return future
+
+    def stream(
+        self, command: str, session: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Send ``command`` now and return an iterator over the reply's deltas."""
+        frames: "queue.Queue" = queue.Queue()
+        request_id = self._send(command, session, frames, stream=True)
+        return self._drain(request_id, frames, timeout)
+
+    def _send(
+        self, command: str, session: Optional[str], target: Union[Future, "queue.Queue"], stream: bool = False
+    ) -> int:
+        request_id = next(self._ids)
+        payload: Dict[str, Any] = {"id": request_id, "command": command}
+        if session:
+            payload["session"] = session
+        if stream:
+            payload["stream"] = True
+        frame = encode_frame(payload)
+        with self._pending_lock:
+            if self._closed:
+                raise ConnectionError("connection closed")
+            self._pending[request_id] = target
+        try:
+            with self._write_lock:
+                self._sock.sendall(frame)
+        except OSError as exc:
+            self._fail(exc)
+            raise
+        return request_id
+
+    def _drain(self, request_id: int, frames: "queue.Queue", timeout: Optional[float]) -> Iterator[str]:
+        try:
+            while True:
+                try:
+                    frame = frames.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError("stream stalled") from None
+                if isinstance(frame, BaseException):
+                    raise frame
+                if "delta" in frame:
+                    yield frame["delta"]
+                elif "error" in frame:
+                    raise ProtocolError(frame["error"])
+                else:
+                    return
+        finally:
+            self._cancel(request_id)
+
+    def _cancel(self, request_id: int) -> None:
+        # An abandoned stream tells the server to stop; the socket stays usable
+        # for the other requests sharing it.
+        with self._pending_lock:
+            if self._closed or self._pending.pop(request_id, None) is None:
+                return
+        try:
+            with self._write_lock:
+                self._sock.sendall(encode_frame({"id": request_id, "cancel": True}))
+        except OSError as exc:
+            self._fail(exc)
+
+    def request(self, command: str, timeout: Optional[float] = None, session: Optional[str] = None) -> str:
+        return self.submit(command, session).result(timeout=timeout)
+
+    def close(self) -> None:
+        self._fail(ConnectionError("connection closed"))
+
+    def _read_loop(self) -> None:
+        try:
+            while True:
+                frame = read_frame(self._rfile)
+                if frame is None:
+                    break
+                request_id = frame.get("id")
+                with self._pending_lock:
+                    if "delta" in frame:
+                        future = self._pending.get(request_id)
+                    else:
+                        future = self._pending.pop(request_id, None)
+                if future is None:
+                    self._parts.pop(request_id, None)
+                    continue
+                if isinstance(future, queue.Queue):
+                    future.put(frame)
+                elif "delta" in frame:
+                    # A reply too large for one frame arrives in pieces.
+                    self._parts.setdefault(request_id, []).append(frame["delta"])
+                elif "error" in frame:
+                    self._parts.pop(request_id, None)
+                    future.set_exception(ProtocolError(frame["error"]))
+                else:
+                    future.set_result("".join(self._parts.pop(request_id, [])) + frame.get("reply", ""))
+            self._fail(ConnectionError("connection closed by server"))
+        except Exception as exc:
+            self._fail(exc)
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._pending_lock:
+            if self._closed:
+                return
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if isinstance(future, queue.Queue):
+                future.put(exc)
+            elif not future.done():
+                future.set_exception(exc)
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+def send_command(
+    host: str, port: int, message: str, timeout: float = 2.0, session: Optional[str] = None
+) -> str:
+    client = FramedClient(host, port, timeout=timeout)
+    try:
+        return client.request(message, timeout=timeout, session=session).strip()
+    finally:
+        client.close()
+
+
+def stream_command(
+    host: str, port: int, message: str, timeout: float = 2.0, session: Optional[str] = None
+) -> Iterator[str]:
+    client = FramedClient(host, port, timeout=timeout)
+    try:
+        yield from client.stream(message, session, timeout)
+    finally:
+        client.close()
+
+
+@dataclass
+class _Shared:
+    client: FramedClient
+    in_flight: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ConnectionPool:
+    """Thread-safe pool of framed connections to the runner, shared by callers.
+
+    Requests and streams are multiplexed over at most ``size`` connections,
+    each carrying up to ``max_in_flight`` of them at once, so long streams
+    never lock short calls such as ``info`` out of the pool.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        size: int = 4,
+        connect_timeout: float = 2.0,
+        health_interval: float = 30.0,
+        max_in_flight: int = 8,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.size = max(1, size)
+        self.connect_timeout = connect_timeout
+        self.health_interval = health_interval
+        self.max_in_flight = max(1, max_in_flight)
+        self._shared: list[_Shared] = []
+        self._connecting = 0
+        self._cond = threading.Condition()
+        self.stats = {"connects": 0, "reuses": 0, "reconnects": 0, "health_failures": 0}
+
+    def request(self, command: str, timeout: Optional[float] = None, session: Optional[str] = None) -> str:
+        shared = self._acquire(timeout)
+        try:
+            try:
+                future = shared.client.submit(command, session)
+            except (ConnectionError, OSError):
+                # Nothing reached the server, so retrying on another socket is safe.
+                shared = self._retry(shared, timeout)
+                future = shared.client.submit(command, session)
+            # A late reply is dropped by the reader; the socket stays usable.
+            return future.result(timeout=timeout).strip()
+        finally:
+            self._release(shared)
+
+    def stream(self, command: str, timeout: Optional[float] = None, session: Optional[str] = None) -> Iterator[str]:
+        shared = self._acquire(timeout)
+        try:
+            try:
+                deltas = shared.client.stream(command, session, timeout)
+            except (ConnectionError, OSError):
+                shared = self._retry(shared, timeout)
+                deltas = shared.client.stream(command, session, timeout)
+            # Closing early cancels the stream on the server, so the socket is kept.
+            yield from deltas
+        finally:
+            self._release(shared)
+
+    def close(self) -> None:
+        with self._cond:
+            shared, self._shared = self._shared, []
+        for entry in shared:
+            entry.client.close()
+
+    def _acquire(self, timeout: Optional[float]) -> _Shared:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while True:
+                    self._shared = [entry for entry in self._shared if not entry.client.closed]
+                    open_ = [entry for entry in self._shared if entry.in_flight < self.max_in_flight]
+                    idle = [entry for entry in open_ if entry.in_flight == 0]
+                    # Spread load over new connections before doubling up on busy ones.
+                    if idle or (open_ and len(self._shared) + self._connecting >= self.size):
+                        shared = idle[0] if idle else min(open_, key=lambda entry: entry.in_flight)
+                        shared.in_flight += 1
+                        self.stats["reuses"] += 1
+                        break
+                    if len(self._shared) + self._connecting < self.size:
+                        self._connecting += 1
+                        shared = None
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("connection pool exhausted")
+                    self._cond.wait(remaining)
+            if shared is None:
+                return self._connect()
+            stale = time.monotonic() - shared.last_used > self.health_interval
+            if shared.in_flight > 1 or not stale or self._healthy(shared.client):
+                return shared
+            self._release(shared)
+
+    def _connect(self) -> _Shared:
+        try:
+            client = FramedClient(self.host, self.port, timeout=self.connect_timeout)
+        except BaseException:
+            with self._cond:
+                self._connecting -= 1
+                self._cond.notify()
+            raise
+        shared = _Shared(client, in_flight=1)
+        with self._cond:
+            self._connecting -= 1
+            self._shared.append(shared)
+            self.stats["connects"] += 1
+            # The new connection has room for more than its first request.
+            self._cond.notify_all()
+        return shared
+
+    def _retry(self, shared: _Shared, timeout: Optional[float]) -> _Shared:
+        with self._cond:
+            self.stats["reconnects"] += 1
+        # The failed connection is already closed, so it no longer takes a slot.
+        replacement = self._acquire(timeout)
+        self._release(shared)
+        return replacement
+
+    def _release(self, shared: _Shared) -> None:
+        with self._cond:
+            shared.in_flight -= 1
+            shared.last_used = time.monotonic()
+            self._cond.notify()
+
+    def _healthy(self, client: FramedClient) -> bool:
+        try:
+            client.request("ping", timeout=self.connect_timeout)
+            return True
+        except Exception:
+            client.close()
+            with self._cond:
+                self.stats["health_failures"] += 1
+            return False
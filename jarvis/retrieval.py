@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import math
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .tokens import estimate_tokens
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it of on or that the this to was what when where which "
+    "who why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _WORD_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+@dataclass
+class Chunk:
+    pack: str
+    text: str
+    tokens: int
+
+
+class BM25Index:
+    """Okapi BM25 over pack chunks, built once and queried per command."""
+
+    def __init__(self, chunks: Iterable[Chunk], k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.chunks: List[Chunk] = list(chunks)
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for doc_id, chunk in enumerate(self.chunks):
+            terms = tokenize(chunk.text)
+            self._lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self._postings.setdefault(term, []).append((doc_id, tf))
+        self._avg_len = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def search(self, query: str, packs: Optional[Iterable[str]] = None, k: int = 4) -> List[Tuple[float, Chunk]]:
+        allowed = set(packs) if packs is not None else None
+        n_docs = len(self.chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                if allowed is not None and self.chunks[doc_id].pack not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / (self._avg_len or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.chunks[doc_id]) for doc_id, score in ranked]
+
+
+class PackRetriever:
+    """Select the pack chunks most relevant to a command within a token budget."""
+
+    def __init__(self, packs: Dict[str, List[str]], top_k: int = 4, token_budget: int = 300) -> None:
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.full_tokens = {name: sum(estimate_tokens(c) for c in chunks) for name, chunks in packs.items()}
+        self.first_chunks = {name: chunks[0] for name, chunks in packs.items() if chunks}
+        self.index = BM25Index(
+            Chunk(pack=name, text=text, tokens=estimate_tokens(text)) for name, chunks in packs.items() for text in chunks
+        )
+        self.stats = {"requests": 0, "tokens_full": 0, "tokens_injected": 0, "tokens_saved": 0, "last_saved": 0}
+        self._lock = threading.Lock()
+
+    def context(self, query: str, active: List[str]) -> str:
+        if not active:
+            return ""
+        hits = [chunk for _, chunk in self.index.search(query, packs=active, k=self.top_k)]
+        if not hits:
+            # Nothing matched lexically; fall back to each pack's lead chunk.
+            hits = [
+                Chunk(pack=name, text=self.first_chunks[name], tokens=estimate_tokens(self.first_chunks[name]))
+                for name in active
+                if name in self.first_chunks
+            ]
+        blocks = []
+        used = 0
+        for chunk in hits:
+            if blocks and used + chunk.tokens > self.token_budget:
+                continue
+            blocks.append(f"[PACK:{chunk.pack}]\n{chunk.text}\n")
+            used += chunk.tokens
+        full = sum(self.full_tokens.get(name, 0) for name in active)
+        saved = max(0, full - used)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["tokens_full"] += full
+            self.stats["tokens_injected"] += used
+            self.stats["tokens_saved"] += saved
+            self.stats["last_saved"] = saved
+        return "\n".join(blocks)
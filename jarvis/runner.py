@@ -4,16 +4,24 @@ import json
 import logging
 import os
 import socketserver
-import urllib.request
-from dataclasses import dataclass
-from typing import List
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional, Tuple
 
 from .actions import configure_interpreter, switch_to_small_ollama
+from .cache import ResponseCache
 from .config import Settings
+from .context import ContextBudget, context_window
 from .logger import setup_logging
 from .memory import MemoryStore
-from .ollama import ensure_ollama_running
-from .packs import PACKS
+from .ollama import ModelWarmer, ensure_ollama_running, get_client, get_inventory, model_name, parse_base
+from .packs import PackLibrary
+from .prompts import PromptCache
+from .protocol import FRAME_MARKER, MAX_FRAME, ProtocolError, encode_frame, read_frame
+from .retrieval import PackRetriever
+from .semantic import OllamaEmbedder, SemanticMemory
+from .sessions import SessionStore
 
 try:
     with open("C:/Users/codym/MyAgent/data/runner_loaded.txt", "w", encoding="utf-8") as handle:
@@ -25,6 +33,21 @@ except Exception:
 class Runner:
     settings: Settings
     memory: MemoryStore
+    cache: Optional[ResponseCache] = None
+    warmer: Optional[ModelWarmer] = None
+    sessions: Optional[SessionStore] = None
+    semantic: Optional[SemanticMemory] = None
+    retriever: Optional[PackRetriever] = None
+    packs: Optional[PackLibrary] = None
+    _packs_cache: Optional[Tuple[int, List[str]]] = field(default=None, init=False, repr=False)
+    prompts: PromptCache = field(init=False, repr=False)
+    _agent: Any = field(default=None, init=False, repr=False)
+    _agent_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.packs is None:
+            self.packs = PackLibrary()
+        self.prompts = PromptCache(self._build_prefix)
 
     def _get_mode(self) -> str:
         return self.memory.get("mode") or "general"
@@ -33,13 +56,19 @@ class Runner:
         self.memory.set("mode", mode)
 
     def _get_active_packs(self) -> List[str]:
+        version = self.memory.kv_version
+        cached = self._packs_cache
+        if cached is not None and cached[0] == version:
+            return list(cached[1])
         raw = self.memory.get("active_packs")
-        if not raw:
-            return []
-        try:
-            return json.loads(raw)
-        except Exception:
-            return []
+        packs: List[str] = []
+        if raw:
+            try:
+                packs = json.loads(raw)
+            except Exception:
+                packs = []
+        self._packs_cache = (version, packs)
+        return list(packs)
 
     def _set_active_packs(self, packs: List[str]) -> None:
         self.memory.set("active_packs", json.dumps(packs))
@@ -65,17 +94,75 @@ class Runner:
             )
         return ""
 
-    def _pack_context(self, active: List[str]) -> str:
+    def _pack_context(self, active: List[str], query: str = "") -> str:
         if not active:
             return ""
+        if self.retriever is not None and query:
+            ctx = self.retriever.context(query, active)
+            logging.info("pack context: saved %s tokens", self.retriever.stats["last_saved"])
+            return ctx
         blocks = []
         for name in active:
-            content = PACKS.get(name)
+            content = self.packs.get(name)
             if content:
                 blocks.append(f"[PACK:{name}]\n{content}\n")
         return "\n".join(blocks)
 
-    def handle_command(self, command: str) -> str:
+    def _build_prefix(self, mode: str, packs: Tuple[str, ...], backend: str) -> str:
+        # With a retriever the pack text depends on the query, so only the mode prefix is static.
+        static_packs = self._pack_context(list(packs)) if self.retriever is None else ""
+        return f"{static_packs}{self._mode_prefix(mode)}"
+
+    def _ollama_options(self) -> dict:
+        # Prompts are fitted to this window, so Ollama must use it rather than its own default.
+        return {"num_ctx": self.settings.ollama_num_ctx}
+
+    def _budget(self, model: str) -> ContextBudget:
+        window = context_window(model, self.settings.ollama_num_ctx, self.settings.context_window)
+        return ContextBudget(model, window, self.settings.context_reserve)
+
+    def _compose(self, command: str, memory_ctx: str, backend: str) -> str:
+        active = self._get_active_packs()
+        prefix = self.prompts.prefix(self._get_mode(), active, backend)
+        pack_ctx = self._pack_context(active, command) if self.retriever is not None else ""
+        payload, _ = self._budget(backend).fit(
+            [
+                ("prefix", prefix.text, "head"),
+                ("packs", pack_ctx, "head"),
+                ("memory", memory_ctx, "head"),
+                ("command", command, "middle"),
+            ],
+            trim_order=("memory", "packs", "prefix"),
+            known={"prefix": prefix.tokens},
+        )
+        return payload
+
+    def on_packs_changed(self, changed: set) -> None:
+        self.prompts.invalidate(changed)
+        if self.retriever is not None:
+            self.retriever = _build_retriever(self.settings, self.packs)
+        if self.semantic is not None:
+            current = {name: self.packs.chunks(name) if name in self.packs else [] for name in changed}
+            # Edited or deleted packs would otherwise keep recalling text that no longer exists.
+            self.semantic.prune_packs_async(current)
+            self.semantic.index_packs(current)
+
+    def _memory_context(self, command: str) -> str:
+        if self.semantic is None:
+            return ""
+        try:
+            # Pack chunks are only recalled for active packs, like the pack context itself.
+            return self.semantic.context_block(
+                command,
+                k=self.settings.semantic_top_k,
+                min_score=self.settings.semantic_min_score,
+                packs=self._get_active_packs(),
+            )
+        except Exception:
+            logging.exception("semantic_search_failed")
+            return ""
+
+    def handle_command(self, command: str, session: Optional[str] = None) -> str:
         logging.info("command: %s", command)
         self.memory.log_event("command", command)
 
@@ -86,8 +173,17 @@ class Runner:
             payload = {
                 "mode": self._get_mode(),
                 "active_packs": self._get_active_packs(),
-                "available_packs": sorted(PACKS.keys()),
+                "available_packs": self.packs.names(),
                 "use_openai": os.getenv("JARVIS_USE_OPENAI", "0") == "1",
+                "cache": self.cache.stats() if self.cache else None,
+                "ollama": get_client(self.settings).stats(),
+                "models": self.warmer.residency() if self.warmer else None,
+                "ollama_models": get_inventory(self.settings).snapshot(),
+                "memory": self.memory.writer_stats(),
+                "semantic": self.semantic.stats() if self.semantic else None,
+                "pack_retrieval": dict(self.retriever.stats) if self.retriever else None,
+                "prompts": self.prompts.stats(),
+                "agent_tools": self._agent.last_run_stats if self._agent is not None else None,
             }
             return json.dumps(payload)
         if command.startswith("/openai "):
@@ -106,10 +202,10 @@ class Runner:
         if command.startswith("/pack "):
             parts = command.split(" ", 2)
             if len(parts) == 2 and parts[1] == "list":
-                return "packs: " + ", ".join(sorted(PACKS.keys()))
+                return "packs: " + ", ".join(self.packs.names())
             if len(parts) >= 3 and parts[1] == "add":
                 name = parts[2].strip()
-                if name not in PACKS:
+                if name not in self.packs:
                     return f"unknown pack: {name}"
                 active = self._get_active_packs()
                 if name not in active:
@@ -123,19 +219,111 @@ class Runner:
                 return f"pack removed: {name}"
             if len(parts) >= 3 and parts[1] == "show":
                 name = parts[2].strip()
-                content = PACKS.get(name)
+                content = self.packs.preview(name)
                 return content or f"unknown pack: {name}"
             if len(parts) == 2 and parts[1] == "clear":
                 self._set_active_packs([])
                 return "packs cleared"
-            return "pack commands: /pack list | /pack add <name> | /pack remove <name> | /pack show <name> | /pack clear"
+            if len(parts) == 2 and parts[1] == "reload":
+                changed = self.packs.refresh()
+                if changed:
+                    self.on_packs_changed(changed)
+                return "packs reloaded: " + (", ".join(sorted(changed)) or "no changes")
+            return "pack commands: /pack list | /pack add <name> | /pack remove <name> | /pack show <name> | /pack clear | /pack reload"
+
+        if cmd == "/session reset":
+            if session and self.sessions:
+                self.sessions.reset(session)
+            return "session reset"
+
+        if command.startswith("/memory search "):
+            if self.semantic is None:
+                return "semantic memory disabled (set JARVIS_SEMANTIC_MEMORY=1)"
+            query = command.split(" ", 2)[2].strip()
+            return json.dumps(self.semantic.search(query, k=self.settings.semantic_top_k))
+
+        if command.startswith("/history search "):
+            return self._history_search(command.split(" ", 2)[2].strip())
+
+        if cmd == "/cache clear":
+            if self.cache:
+                self.cache.clear()
+            return "cache cleared"
+
+        use_cache = True
+        if command.startswith("/nocache "):
+            command = command.split(" ", 1)[1].strip()
+            use_cache = False
+
+        reply = self._answer(command, use_cache, session)
+        self._record(command, reply, session)
+        return reply
+
+    def stream_command(self, command: str, session: Optional[str] = None) -> Iterator[str]:
+        """Like handle_command, but yields the reply in pieces as the backend produces them."""
+        if _is_control(command):
+            yield self.handle_command(command, session)
+            return
+        logging.info("command: %s", command)
+        self.memory.log_event("command", command)
+
+        use_cache = True
+        if command.startswith("/nocache "):
+            command = command.split(" ", 1)[1].strip()
+            use_cache = False
 
+        parts = []
+        deltas = self._answer_stream(command, use_cache, session)
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                yield delta
+        finally:
+            deltas.close()
+        self._record(command, "".join(parts).strip() or "ok", session)
+
+    def _record(self, command: str, reply: str, session: Optional[str]) -> None:
+        self.memory.log_exchange(command, reply, session)
+        if self.semantic is not None and not reply.startswith("error:"):
+            self.semantic.add_async(f"Q: {command}\nA: {reply}", "exchange")
+
+    def _history_search(self, query: str) -> str:
+        results = self.memory.search_exchanges(query, limit=self.settings.history_search_limit)
+        return json.dumps(results)
+
+    def _answer(self, command: str, use_cache: bool, session: Optional[str]) -> str:
         backend = os.getenv("JARVIS_BACKEND", "ollama").strip().lower()
 
+        memory_ctx = self._memory_context(command)
+
+        if _use_openai():
+            return self._openai_answer(command, memory_ctx)
+
         if backend in ("ollama", "local", "llm"):
-            reply = self._ollama_generate(command)
+            prompt = self._ollama_prompt(command, memory_ctx)
+            reply = self._ollama_generate(prompt, use_cache=use_cache, session=session)
             return reply or "ok"
 
+        return self._interpreter_answer(command, memory_ctx)
+
+    def _answer_stream(self, command: str, use_cache: bool, session: Optional[str]) -> Iterator[str]:
+        backend = os.getenv("JARVIS_BACKEND", "ollama").strip().lower()
+
+        memory_ctx = self._memory_context(command)
+
+        if _use_openai():
+            yield from self._openai_stream(command, memory_ctx)
+            return
+
+        if backend in ("ollama", "local", "llm"):
+            prompt = self._ollama_prompt(command, memory_ctx)
+            yield from self._ollama_stream(prompt, use_cache=use_cache, session=session)
+            return
+
+        # open-interpreter runs its own loop and has no incremental output to forward.
+        yield self._interpreter_answer(command, memory_ctx)
+
+    def _interpreter_answer(self, command: str, memory_ctx: str) -> str:
         try:
             from interpreter import interpreter
             try:
@@ -146,11 +334,7 @@ class Runner:
             except Exception:
                 pass
 
-            mode = self._get_mode()
-            active = self._get_active_packs()
-            prefix = self._mode_prefix(mode)
-            pack_ctx = self._pack_context(active)
-            payload = f"{pack_ctx}{prefix}{command}"
+            payload = self._compose(command, memory_ctx, _interpreter_model(interpreter))
             interpreter.chat(payload, display=False)
             return "ok"
         except Exception as exc:
@@ -162,88 +346,392 @@ class Runner:
                     try:
                         from interpreter import interpreter
 
-                        mode = self._get_mode()
-                        active = self._get_active_packs()
-                        prefix = self._mode_prefix(mode)
-                        pack_ctx = self._pack_context(active)
-                        payload = f"{pack_ctx}{prefix}{command}"
+                        payload = self._compose(command, memory_ctx, _interpreter_model(interpreter))
                         interpreter.chat(payload, display=False)
                         return f"ok (fallback:{picked})"
                     except Exception as exc2:
+                        get_inventory(self.settings).invalidate()
                         logging.exception("command_failed_fallback")
                         return f"error: {exc2}"
             logging.exception("command_failed")
             return f"error: {exc}"
 
-    def _ollama_generate(self, prompt: str) -> str:
-        model = os.getenv("JARVIS_OLLAMA_CHAT_MODEL", "gemma:2b")
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-        }
-        data = json.dumps(payload).encode("utf-8")
+    def _openai_agent(self):
+        with self._agent_lock:
+            if self._agent is None:
+                from .openai_agent import OpenAIAgent
+
+                self._agent = OpenAIAgent(model=self.settings.openai_model)
+            return self._agent
+
+    def _openai_answer(self, command: str, memory_ctx: str) -> str:
+        text = ""
+        for event in self._openai_events(command, memory_ctx):
+            if event["type"] == "done":
+                text = event["text"]
+            elif event["type"] == "error":
+                return event["text"]
+        return text or "ok"
+
+    def _openai_stream(self, command: str, memory_ctx: str) -> Iterator[str]:
+        for event in self._openai_events(command, memory_ctx):
+            if event["type"] == "text":
+                yield event["delta"]
+            elif event["type"] == "tool_call":
+                yield f"\n[tool] {event['name']}\n"
+            elif event["type"] == "error":
+                yield event["text"]
+
+    def _openai_events(self, command: str, memory_ctx: str) -> Iterator[dict]:
         try:
-            req = urllib.request.Request(
-                "http://127.0.0.1:11434/api/generate",
-                data=data,
-                headers={"Content-Type": "application/json"},
-                method="POST",
-            )
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                raw = resp.read().decode("utf-8", errors="ignore")
-            out = json.loads(raw)
-            return out.get("response", "").strip()
+            agent = self._openai_agent()
+            yield from agent.stream(self._compose(command, memory_ctx, agent.model))
+        except Exception as exc:
+            logging.exception("openai_agent_failed")
+            yield {"type": "error", "text": f"error: {exc}"}
+
+    def _ollama_prompt(self, command: str, memory_ctx: str) -> str:
+        prompt, _ = self._budget(self.settings.ollama_chat_model).fit(
+            [("memory", memory_ctx, "head"), ("command", command, "middle")], trim_order=("memory",)
+        )
+        return prompt
+
+    def _ollama_prepare(
+        self, model: str, prompt: str, use_cache: bool, session: Optional[str]
+    ) -> Tuple[Optional[List[int]], Optional[str], Optional[str]]:
+        """Return (session context, cache key, cached reply) for an Ollama request."""
+        context = None
+        if session and self.sessions is not None:
+            context = self.sessions.get_context(session, model)
+            if context:
+                budget = self._budget(model)
+                context = budget.trim_history(context, budget.count(prompt))
+            # Session replies depend on prior turns, so they never hit the shared cache.
+            use_cache = False
+        key = None
+        if self.cache is not None:
+            if use_cache:
+                key = ResponseCache.make_key(model, prompt, mode=self._get_mode(), packs=self._get_active_packs())
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return context, key, cached
+            elif not session:
+                self.cache.note_bypass()
+        return context, key, None
+
+    def _ollama_finish(
+        self, model: str, session: Optional[str], context: Optional[List[int]], key: Optional[str], reply: str
+    ) -> None:
+        if session and self.sessions is not None and context:
+            self.sessions.set_context(session, model, context)
+        if key is not None and reply:
+            self.cache.put(key, reply)
+
+    def _ollama_generate(self, prompt: str, use_cache: bool = True, session: Optional[str] = None) -> str:
+        model = self.settings.ollama_chat_model
+        context, key, cached = self._ollama_prepare(model, prompt, use_cache, session)
+        if cached is not None:
+            return cached
+        try:
+            out = get_client(self.settings).generate(model, prompt, options=self._ollama_options(), context=context)
+            reply = out.get("response", "").strip()
         except Exception as exc:
+            get_inventory(self.settings).invalidate()
             return f"error: {exc}"
+        self._ollama_finish(model, session, out.get("context"), key, reply)
+        return reply
+
+    def _ollama_stream(self, prompt: str, use_cache: bool = True, session: Optional[str] = None) -> Iterator[str]:
+        model = self.settings.ollama_chat_model
+        context, key, cached = self._ollama_prepare(model, prompt, use_cache, session)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        final_context = None
+        chunks = get_client(self.settings).generate_stream(
+            model, prompt, options=self._ollama_options(), context=context
+        )
+        try:
+            for chunk in chunks:
+                text = chunk.get("response", "")
+                if text:
+                    parts.append(text)
+                    yield text
+                if chunk.get("done"):
+                    final_context = chunk.get("context")
+        except Exception as exc:
+            get_inventory(self.settings).invalidate()
+            yield f"error: {exc}"
+            return
+        finally:
+            # Closing the upstream stream makes Ollama stop generating.
+            chunks.close()
+        self._ollama_finish(model, session, final_context, key, "".join(parts).strip())
+
+
+def _use_openai() -> bool:
+    return os.getenv("JARVIS_USE_OPENAI", "0") == "1"
+
+
+_READ_ONLY_CONTROL = ("ping", "info", "/pack list", "/pack show ", "/memory search ", "/history search ")
+
+
+def _is_control(command: str) -> bool:
+    """Commands answered from runner state rather than by a model."""
+    text = command.strip()
+    return text.lower() in ("ping", "info") or (text.startswith("/") and not text.startswith("/nocache "))
+
+
+def _changes_state(command: str) -> bool:
+    text = command.strip()
+    return _is_control(text) and not text.lower().startswith(_READ_ONLY_CONTROL)
+
+
+def _interpreter_model(interpreter) -> str:
+    llm = getattr(interpreter, "llm", None)
+    return str(getattr(llm, "model", None) or "interpreter")
+
+
+# JSON escaping can turn one character into up to 12 bytes, so pieces this long always fit a frame.
+_PIECE = MAX_FRAME // 12
+
+
+def _frames(payload: dict) -> Iterator[bytes]:
+    """Encode ``payload``, splitting text too large for one frame into deltas the client joins."""
+    try:
+        yield encode_frame(payload)
+        return
+    except ProtocolError:
+        pass
+    key = "delta" if "delta" in payload else "reply"
+    if key not in payload:
+        yield encode_frame({"id": payload.get("id"), "error": "reply too large"})
+        return
+    text = str(payload[key])
+    for start in range(0, len(text), _PIECE):
+        yield encode_frame({"id": payload.get("id"), "delta": text[start : start + _PIECE]})
+    if key == "reply":
+        yield encode_frame({"id": payload.get("id"), "reply": ""})
 
 
 class _TCPHandler(socketserver.StreamRequestHandler):
     def handle(self) -> None:
+        first = self.rfile.peek(1)[:1]
+        if not first:
+            return
+        if first == FRAME_MARKER:
+            self._handle_framed()
+            return
+        # Legacy mode: one newline-terminated command per connection.
         data = self.rfile.readline().decode("utf-8", errors="ignore").strip()
         if not data:
             return
         result = self.server.runner.handle_command(data)
         self.wfile.write((result + "\n").encode("utf-8"))
 
+    def _handle_framed(self) -> None:
+        write_lock = threading.Lock()
+        self._cancelled: set = set()
+        inflight = []
+        barrier = None
+        try:
+            while True:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    break
+                if frame.get("cancel"):
+                    self._cancelled.add(frame.get("id"))
+                    continue
+                inflight = [f for f in inflight if not f.done()]
+                if barrier is not None and barrier.done():
+                    barrier = None
+                command = str(frame.get("command", ""))
+                # A state change runs after this connection's earlier requests and
+                # before its later ones. It is queued rather than waited for here,
+                # so the connection keeps reading while it is pending.
+                if _changes_state(command) and inflight:
+                    barrier = self.server.executor.submit(self._dispatch_after, list(inflight), frame, write_lock)
+                    inflight.append(barrier)
+                    continue
+                after = [barrier] if barrier is not None else []
+                # Control commands are cheap, so they never queue behind long
+                # generations on the shared pool. Probes report the state as it is
+                # now and skip the ordering, since callers share pooled connections.
+                if _is_control(command) and (not after or command.strip().lower() in ("ping", "info")):
+                    self._dispatch(frame, write_lock)
+                    continue
+                inflight.append(self.server.executor.submit(self._dispatch_after, after, frame, write_lock))
+        except (ProtocolError, ValueError, OSError, RuntimeError) as exc:
+            logging.warning("framed connection dropped: %s", exc)
+        wait(inflight)
+
+    def _dispatch_after(self, after: List[Future], frame: dict, write_lock: threading.Lock) -> None:
+        # Only earlier submissions are waited on, so this cannot deadlock the executor.
+        wait(after)
+        self._dispatch(frame, write_lock)
+
+    def _dispatch(self, frame: dict, write_lock: threading.Lock) -> None:
+        request_id = frame.get("id")
+        try:
+            command = str(frame.get("command", ""))
+            if frame.get("stream"):
+                reply = self._stream_reply(request_id, command, frame.get("session"), write_lock)
+                if reply is None:
+                    return
+            else:
+                reply = {"id": request_id, "reply": self.server.runner.handle_command(command, frame.get("session"))}
+        except Exception as exc:
+            logging.exception("command_failed")
+            reply = {"id": request_id, "error": str(exc)}
+        try:
+            self._write(reply, write_lock)
+        except OSError:
+            pass
+
+    def _write(self, payload: dict, write_lock: threading.Lock) -> None:
+        with write_lock:
+            for frame in _frames(payload):
+                self.wfile.write(frame)
+            self.wfile.flush()
+
+    def _stream_reply(self, request_id, command: str, session: Optional[str], write_lock: threading.Lock) -> Optional[dict]:
+        deltas = self.server.runner.stream_command(command, session)
+        try:
+            for delta in deltas:
+                if request_id in self._cancelled:
+                    # The client abandoned the stream; closing the generator stops the backend.
+                    return None
+                self._write({"id": request_id, "delta": delta}, write_lock)
+        except OSError:
+            # Client went away mid-stream; closing the generator stops the backend.
+            return None
+        finally:
+            deltas.close()
+            self._cancelled.discard(request_id)
+        # The deltas already carried the text; this frame only ends the stream.
+        return {"id": request_id, "reply": ""}
+
 
 class JarvisServer(socketserver.ThreadingTCPServer):
     allow_reuse_address = True
+    daemon_threads = True
 
-    def __init__(self, host: str, port: int, runner: Runner) -> None:
+    def __init__(self, host: str, port: int, runner: Runner, max_workers: int = 8) -> None:
         super().__init__((host, port), _TCPHandler)
         self.runner = runner
+        # Pipelined model requests from one connection run concurrently on this pool.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jarvis-cmd")
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def _build_cache(settings: Settings, memory: MemoryStore) -> Optional[ResponseCache]:
+    if settings.cache_size <= 0:
+        return None
+    cache = ResponseCache(settings.cache_size, settings.cache_ttl, memory if settings.cache_persist else None)
+    cache.prune()
+    return cache
+
+
+def _build_retriever(settings: Settings, packs: PackLibrary) -> Optional[PackRetriever]:
+    if settings.pack_top_k <= 0:
+        return None
+    return PackRetriever(packs.all_chunks(), top_k=settings.pack_top_k, token_budget=settings.pack_token_budget)
+
+
+def _build_semantic(settings: Settings, memory: MemoryStore, packs: PackLibrary) -> Optional[SemanticMemory]:
+    if not settings.semantic_memory:
+        return None
+    try:
+        semantic = SemanticMemory(memory, OllamaEmbedder(get_client(settings), settings.embed_model))
+    except RuntimeError as exc:
+        logging.warning("semantic memory disabled: %s", exc)
+        return None
+    current = packs.all_chunks()
+    # Packs deleted while the server was down still have vectors on disk.
+    semantic.prune_packs({**{name: [] for name in semantic.pack_names()}, **current})
+    semantic.index_packs(current)
+    return semantic
+
+
+def _start_warmup(settings: Settings) -> Optional[ModelWarmer]:
+    if not settings.ollama_warmup:
+        return None
+    models = [settings.ollama_chat_model, model_name(settings.ollama_model)]
+    warmer = ModelWarmer(get_client(settings), models, options={"num_ctx": settings.ollama_num_ctx})
+    warmer.start()
+    return warmer
 
 
 def serve(settings: Settings) -> None:
     setup_logging(settings.log_file)
-    ensure_ollama_running()
+    ensure_ollama_running(*parse_base(settings.ollama_base))
+    get_inventory(settings).start()
+    warmer = _start_warmup(settings)
     configure_interpreter(settings)
 
-    memory = MemoryStore(settings.memory_db)
-    runner = Runner(settings=settings, memory=memory)
+    memory = MemoryStore(settings.memory_db, async_events=settings.memory_async_events)
+    packs = PackLibrary(settings.packs_dir)
+    memory.start_retention(
+        settings.events_retention_days * 86400,
+        settings.events_archive_dir or None,
+        session_max_age=settings.session_ttl_days * 86400,
+    )
+    runner = Runner(
+        settings=settings,
+        memory=memory,
+        cache=_build_cache(settings, memory),
+        warmer=warmer,
+        sessions=SessionStore(memory),
+        semantic=_build_semantic(settings, memory, packs),
+        retriever=_build_retriever(settings, packs),
+        packs=packs,
+    )
+
+    packs.start_watching(settings.pack_reload_interval, runner.on_packs_changed)
 
     logging.info("jarvis server starting on %s:%s", settings.server_host, settings.server_port)
-    server = JarvisServer(settings.server_host, settings.server_port, runner)
-    with server:
-        server.serve_forever()
+    server = JarvisServer(settings.server_host, settings.server_port, runner, settings.server_workers)
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        packs.stop_watching()
+        memory.close()
 
 
 def run_interactive(settings: Settings) -> None:
     setup_logging(settings.log_file)
-    ensure_ollama_running()
+    ensure_ollama_running(*parse_base(settings.ollama_base))
     configure_interpreter(settings)
 
-    memory = MemoryStore(settings.memory_db)
-    runner = Runner(settings=settings, memory=memory)
+    memory = MemoryStore(settings.memory_db, async_events=settings.memory_async_events)
+    packs = PackLibrary(settings.packs_dir)
+    runner = Runner(
+        settings=settings,
+        memory=memory,
+        cache=_build_cache(settings, memory),
+        sessions=SessionStore(memory),
+        semantic=_build_semantic(settings, memory, packs),
+        retriever=_build_retriever(settings, packs),
+        packs=packs,
+    )
 
     logging.info("jarvis interactive started")
-    while True:
-        try:
-            command = input("Command: ").strip()
-        except (EOFError, KeyboardInterrupt):
-            print("\nExiting.")
-            return
-        if not command:
-            continue
-        runner.handle_command(command)
+    try:
+        while True:
+            try:
+                command = input("Command: ").strip()
+            except (EOFError, KeyboardInterrupt):
+                print("\nExiting.")
+                return
+            if not command:
+                continue
+            for delta in runner.stream_command(command, session="interactive"):
+                print(delta, end="", flush=True)
+            print()
+    finally:
+        memory.close()
@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from .memory import MemoryStore
+from .ollama import OllamaClient
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - optional at runtime
+    np = None
+
+
+Embedder = Callable[[str], Sequence[float]]
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy not installed")
+
+
+class OllamaEmbedder:
+    def __init__(self, client: OllamaClient, model: str) -> None:
+        self.client = client
+        self.model = model
+
+    def __call__(self, text: str) -> List[float]:
+        return self.client.embeddings(self.model, text)
+
+
+class HashEmbedder:
+    """Deterministic hashing-trick embedder for tests and offline use."""
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def __call__(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vec[index] += 1.0 if digest[4] & 1 else -1.0
+        return vec
+
+
+class SemanticMemory:
+    """Embedding index over commands, replies and pack chunks.
+
+    Vectors are L2-normalised float32 rows persisted as BLOBs in the
+    MemoryStore ``vectors`` table and held in one contiguous matrix, so a
+    query is a single matrix-vector product. Past ``ivf_threshold`` rows a
+    k-means inverted file narrows the scan to the ``nprobe`` closest lists;
+    it is built on the background executor, and searches stay exact until
+    it is ready. Pack chunks are tagged with their pack, so searches can be limited to
+    the active packs.
+    """
+
+    def __init__(
+        self,
+        memory: MemoryStore,
+        embedder: Embedder,
+        ivf_threshold: int = 100_000,
+        nprobe: int = 8,
+    ) -> None:
+        _require_numpy()
+        self.memory = memory
+        self.embedder = embedder
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._matrix: Optional["np.ndarray"] = None
+        self._size = 0
+        self._dim: Optional[int] = None
+        self._meta: List[Dict[str, Any]] = []
+        self._refs: set = set()
+        # Per-row index into _pack_ids, or -1 for rows that are not pack chunks.
+        self._owners: Optional["np.ndarray"] = None
+        self._pack_ids: Dict[str, int] = {}
+        self._centroids: Optional["np.ndarray"] = None
+        # Grown alongside _matrix; valid for every row once _centroids is set.
+        self._assignments: Optional["np.ndarray"] = None
+        self._indexed_at = 0
+        self._building = False
+        # Bumped whenever rows are removed, which invalidates row positions.
+        self._generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jarvis-embed")
+        self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, text: str, kind: str, ref: Optional[str] = None) -> bool:
+        if not text.strip():
+            return False
+        with self._lock:
+            if ref is not None and ref in self._refs:
+                return False
+        vector = self._normalise(self.embedder(text))
+        if vector is None:
+            return False
+        with self._lock:
+            if self._dim is not None and vector.shape[0] != self._dim:
+                logging.warning("embedding dim %s does not match index dim %s", vector.shape[0], self._dim)
+                return False
+            if ref is not None and ref in self._refs:
+                return False
+            row_id = self.memory.add_vector(kind, ref, text, vector.tobytes(), int(vector.shape[0]))
+            self._append(vector, {"id": row_id, "kind": kind, "ref": ref, "text": text})
+        return True
+
+    def add_async(self, text: str, kind: str, ref: Optional[str] = None) -> None:
+        def _run() -> None:
+            try:
+                self.add(text, kind, ref)
+            except Exception:
+                logging.exception("semantic_index_failed")
+
+        self._executor.submit(_run)
+
+    def index_packs(self, packs: Dict[str, List[str]]) -> None:
+        for name, chunks in packs.items():
+            for chunk in chunks:
+                self.add_async(chunk, "pack", ref=_pack_ref(name, chunk))
+
+    def prune_packs(self, packs: Dict[str, List[str]]) -> int:
+        """Drop stored chunks of each pack that are not in its current chunk list.
+
+        A pack mapped to an empty list (a deleted pack) loses every chunk.
+        Unchanged chunks keep their vectors, so reindexing only embeds new text.
+        """
+        with self._lock:
+            removed: set = set()
+            for name, chunks in packs.items():
+                keep = {_pack_ref(name, chunk) for chunk in chunks}
+                removed.update(self.memory.delete_pack_vectors(name, keep))
+            if removed:
+                self._drop_rows(removed)
+            return len(removed)
+
+    def prune_packs_async(self, packs: Dict[str, List[str]]) -> None:
+        # Queued on the same single worker as add_async, so it runs before any reindex queued after it.
+        def _run() -> None:
+            try:
+                removed = self.prune_packs(packs)
+                if removed:
+                    logging.info("dropped %s stale pack vectors", removed)
+            except Exception:
+                logging.exception("semantic_prune_failed")
+
+        self._executor.submit(_run)
+
+    def pack_names(self) -> List[str]:
+        with self._lock:
+            return list(self._pack_ids)
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        kinds: Optional[Sequence[str]] = None,
+        min_score: float = 0.0,
+        packs: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return the ``k`` closest rows; with ``packs``, only chunks of those packs are eligible."""
+        vector = self._normalise(self.embedder(query))
+        with self._lock:
+            if vector is None or self._matrix is None or not self._size or vector.shape[0] != self._dim:
+                return []
+            candidates = self._candidates(vector)
+            rows = self._matrix[: self._size] if candidates is None else self._matrix[candidates]
+            scores = rows @ vector
+            if kinds:
+                wanted = set(kinds)
+                ids = candidates if candidates is not None else np.arange(self._size)
+                mask = np.fromiter((self._meta[i]["kind"] in wanted for i in ids), dtype=bool, count=len(ids))
+                scores = np.where(mask, scores, -np.inf)
+            if packs is not None:
+                owners = self._owners[: self._size] if candidates is None else self._owners[candidates]
+                allowed = [self._pack_ids[name] for name in packs if name in self._pack_ids]
+                scores = np.where((owners < 0) | np.isin(owners, allowed), scores, -np.inf)
+            take = min(k, scores.shape[0])
+            top = np.argpartition(-scores, take - 1)[:take]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for pos in top:
+                score = float(scores[pos])
+                if not np.isfinite(score) or score < min_score:
+                    continue
+                index = int(candidates[pos]) if candidates is not None else int(pos)
+                results.append({**self._meta[index], "score": round(score, 4)})
+            return results
+
+    def context_block(
+        self,
+        query: str,
+        k: int = 3,
+        min_score: float = 0.3,
+        max_chars: int = 1500,
+        packs: Optional[Iterable[str]] = None,
+    ) -> str:
+        hits = self.search(query, k=k, min_score=min_score, packs=packs)
+        lines: List[str] = []
+        used = 0
+        for hit in hits:
+            snippet = hit["text"].strip()
+            if used + len(snippet) > max_chars:
+                break
+            lines.append(f"- ({hit['kind']}) {snippet}")
+            used += len(snippet)
+        if not lines:
+            return ""
+        return "[MEMORY]\n" + "\n".join(lines) + "\n"
+
+    def build_index(self, n_lists: Optional[int] = None, iterations: int = 8) -> None:
+        with self._lock:
+            if self._matrix is None or not self._size:
+                return
+            # Rows below _size are never rewritten, so the k-means can run on
+            # this view without holding the lock while adds and searches go on.
+            size = self._size
+            data = self._matrix[:size]
+            generation = self._generation
+        n_lists = n_lists or max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(size, size=min(n_lists, size), replace=False)].copy()
+        sample = data if size <= 50_000 else data[rng.choice(size, size=50_000, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(centroids.shape[0]):
+                members = sample[labels == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[c] = centroid / norm if norm else centroid
+        centroids = centroids.astype(np.float32)
+        labels = np.argmax(data @ centroids.T, axis=1)
+        with self._lock:
+            if generation != self._generation:
+                # Rows were removed meanwhile; the next search schedules a fresh build.
+                return
+            assignments = np.empty(self._matrix.shape[0], dtype=np.int32)
+            assignments[:size] = labels
+            if self._size > size:
+                # Rows added while the index was being built.
+                assignments[size : self._size] = np.argmax(self._matrix[size : self._size] @ centroids.T, axis=1)
+            self._centroids = centroids
+            self._assignments = assignments
+            self._indexed_at = self._size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "vectors": self._size,
+                "dim": self._dim,
+                "ivf_lists": int(self._centroids.shape[0]) if self._centroids is not None else 0,
+                "ivf_building": self._building,
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _candidates(self, vector: "np.ndarray") -> Optional["np.ndarray"]:
+        if self._size < self.ivf_threshold:
+            return None
+        if self._centroids is None or self._size > 2 * self._indexed_at:
+            self._schedule_build()
+        if self._centroids is None:
+            return None
+        probe = np.argsort(-(self._centroids @ vector))[: self.nprobe]
+        return np.nonzero(np.isin(self._assignments[: self._size], probe))[0]
+
+    def _schedule_build(self) -> None:
+        if self._building:
+            return
+        self._building = True
+
+        def _run() -> None:
+            try:
+                self.build_index()
+            except Exception:
+                logging.exception("semantic_index_build_failed")
+            finally:
+                with self._lock:
+                    self._building = False
+
+        try:
+            self._executor.submit(_run)
+        except RuntimeError:
+            # Executor already shut down; keep serving exact search.
+            self._building = False
+
+    def _normalise(self, values: Sequence[float]) -> Optional["np.ndarray"]:
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.ndim != 1 or not vector.size:
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _append(self, vector: "np.ndarray", meta: Dict[str, Any]) -> None:
+        if self._matrix is None:
+            self._dim = int(vector.shape[0])
+            self._matrix = np.empty((64, self._dim), dtype=np.float32)
+            self._owners = np.empty(64, dtype=np.int32)
+        elif self._size == self._matrix.shape[0]:
+            # Grow geometrically so appends stay amortised O(1).
+            self._matrix = _grown(self._matrix, self._size)
+            self._owners = _grown(self._owners, self._size)
+            if self._assignments is not None:
+                self._assignments = _grown(self._assignments, self._size)
+        self._matrix[self._size] = vector
+        self._owners[self._size] = self._owner(meta)
+        if self._centroids is not None:
+            self._assignments[self._size] = int(np.argmax(self._centroids @ vector))
+        self._size += 1
+        self._meta.append(meta)
+        if meta.get("ref"):
+            self._refs.add(meta["ref"])
+
+    def _drop_rows(self, ids: set) -> None:
+        keep = np.fromiter((meta["id"] not in ids for meta in self._meta), dtype=bool, count=self._size)
+        if keep.all():
+            return
+        self._matrix = _compacted(self._matrix, keep)
+        self._owners = _compacted(self._owners, keep)
+        if self._assignments is not None:
+            self._assignments = _compacted(self._assignments, keep)
+        self._meta = [meta for meta, kept in zip(self._meta, keep) if kept]
+        self._refs = {meta["ref"] for meta in self._meta if meta.get("ref")}
+        self._size = len(self._meta)
+        self._indexed_at = min(self._indexed_at, self._size)
+        self._generation += 1
+
+    def _owner(self, meta: Dict[str, Any]) -> int:
+        ref = meta.get("ref") or ""
+        if meta.get("kind") != "pack" or not ref.startswith("pack:"):
+            return -1
+        # Refs are "pack:<name>:<digest>".
+        name = ref[len("pack:") :].rsplit(":", 1)[0]
+        return self._pack_ids.setdefault(name, len(self._pack_ids))
+
+    def _load(self) -> None:
+        for row_id, kind, ref, text, dim, blob in self.memory.iter_vectors():
+            if self._dim is not None and dim != self._dim:
+                continue
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if vector.shape[0] != dim:
+                continue
+            self._append(vector, {"id": row_id, "kind": kind, "ref": ref, "text": text})
+
+
+def _grown(array: "np.ndarray", size: int) -> "np.ndarray":
+    grown = np.empty((array.shape[0] * 2,) + array.shape[1:], dtype=array.dtype)
+    grown[:size] = array[:size]
+    return grown
+
+
+def _compacted(array: "np.ndarray", keep: "np.ndarray") -> "np.ndarray":
+    # A fresh array of the same capacity, so a build reading the old one is unaffected.
+    compacted = np.empty_like(array)
+    kept = array[: keep.shape[0]][keep]
+    compacted[: kept.shape[0]] = kept
+    return compacted
+
+
+def _pack_ref(name: str, chunk: str) -> str:
+    digest = hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16]
+    return f"pack:{name}:{digest}"
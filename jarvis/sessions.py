@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .memory import MemoryStore
+
+
+class SessionStore:
+    """Per-session Ollama context tokens, cached in memory and persisted to MemoryStore.
+
+    Follow-up turns send the stored context back to /api/generate so Ollama
+    only has to prefill the new prompt instead of the whole conversation.
+    """
+
+    def __init__(self, memory: MemoryStore, max_sessions: int = 128) -> None:
+        self.memory = memory
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, Tuple[str, List[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_context(self, session: str, model: str) -> Optional[List[int]]:
+        with self._lock:
+            entry = self._sessions.get(session)
+            if entry is not None:
+                self._sessions.move_to_end(session)
+        if entry is None:
+            row = self.memory.get_session(session)
+            if row is None:
+                return None
+            try:
+                entry = (row[0], json.loads(row[1]))
+            except ValueError:
+                return None
+            self._remember(session, entry)
+        # Context tokens are only meaningful to the model that produced them.
+        if entry[0] != model:
+            return None
+        return entry[1]
+
+    def set_context(self, session: str, model: str, context: List[int]) -> None:
+        self._remember(session, (model, list(context)))
+        self.memory.set_session(session, model, json.dumps(context))
+
+    def reset(self, session: str) -> None:
+        with self._lock:
+            self._sessions.pop(session, None)
+        self.memory.delete_session(session)
+
+    def _remember(self, session: str, entry: Tuple[str, List[int]]) -> None:
+        with self._lock:
+            self._sessions[session] = entry
+            self._sessions.move_to_end(session)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _StreamFlight:
+    def __init__(self) -> None:
+        self.cond = threading.Condition()
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cancelled = False
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one upstream call.
+
+    The first caller for a key becomes the leader and runs the work; callers
+    that arrive while it is in flight wait for and share its result. Streams
+    are pumped by a background thread and fanned out to every subscriber,
+    each of which sees the full sequence of chunks from the start.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._counters = {"leaders": 0, "coalesced": 0, "stream_leaders": 0, "stream_coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                self._counters["leaders"] += 1
+                leader = True
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return future.result()
+
+    def stream(self, key: str, factory: Callable[[], Iterator[T]]) -> Iterator[T]:
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is not None and flight.cancelled:
+                flight = None
+            leader = flight is None
+            if leader:
+                flight = _StreamFlight()
+                self._streams[key] = flight
+                self._counters["stream_leaders"] += 1
+            else:
+                self._counters["stream_coalesced"] += 1
+            with flight.cond:
+                flight.subscribers += 1
+        if leader:
+            threading.Thread(
+                target=self._pump, args=(key, flight, factory), name="jarvis-singleflight", daemon=True
+            ).start()
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.chunks) and not flight.done:
+                        flight.cond.wait()
+                    if index < len(flight.chunks):
+                        chunk = flight.chunks[index]
+                        index += 1
+                    elif flight.error is not None:
+                        raise flight.error
+                    else:
+                        return
+                yield chunk
+        finally:
+            with flight.cond:
+                flight.subscribers -= 1
+                if flight.subscribers == 0 and not flight.done:
+                    # Everyone hung up; let the pump stop pulling from upstream.
+                    flight.cancelled = True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._counters)
+            out["inflight"] = len(self._calls) + len(self._streams)
+        return out
+
+    def _pump(self, key: str, flight: _StreamFlight, factory: Callable[[], Iterator[Any]]) -> None:
+        upstream: Optional[Iterator[Any]] = None
+        try:
+            upstream = factory()
+            for chunk in upstream:
+                with flight.cond:
+                    if flight.cancelled:
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as exc:
+            flight.error = exc
+        finally:
+            close = getattr(upstream, "close", None)
+            if close:
+                close()
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
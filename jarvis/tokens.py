@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Callable
+
+try:
+    import tiktoken
+except Exception:  # pragma: no cover - optional at runtime
+    tiktoken = None
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: words and punctuation, or chars/4 if that is larger."""
+    if not text:
+        return 0
+    return max(len(_TOKEN_RE.findall(text)), len(text) // 4)
+
+
+@lru_cache(maxsize=32)
+def token_counter(model: str = "") -> TokenCounter:
+    """Exact counter for OpenAI models when tiktoken is installed, else the estimator."""
+    if tiktoken is None or not model or model.startswith("ollama/") or ":" in model:
+        return estimate_tokens
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception:
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=())) if text else 0
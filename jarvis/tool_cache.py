@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+CACHEABLE_TOOLS = frozenset({"read_file", "list_files"})
+MUTATING_TOOLS = frozenset({"write_file", "run_command"})
+
+
+def _resolve(path: str) -> str:
+    return str(Path(path).expanduser().resolve())
+
+
+def _file_fingerprint(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _unchanged(stamps: Tuple[Tuple[str, int], ...]) -> bool:
+    # Adding, removing or renaming an entry bumps its parent directory's mtime,
+    # so re-stating the directories a listing read tells whether it still holds.
+    for path, mtime in stamps:
+        try:
+            if os.stat(path).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+class ToolResultCache:
+    """Per-run memo for read_file and list_files, revalidated against the filesystem.
+
+    Every lookup re-stats the file (mtime and size) or the directories the
+    listing actually scanned, so a hit is only served while the result still
+    holds; write_file and run_command additionally drop the entries they may
+    affect. Listings with per-file stats are not cached, since file edits do
+    not touch directory mtimes.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[Tuple[str, str, str], Tuple[Any, Any]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"tool_calls": 0, "cache_hits": 0, "cache_misses": 0, "cache_stale": 0, "invalidations": 0}
+
+    def call(self, name: str, args: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._counters["tool_calls"] += 1
+        if name in MUTATING_TOOLS:
+            try:
+                return fn()
+            finally:
+                self._invalidate(name, args)
+        if name not in CACHEABLE_TOOLS or args.get("include_stats"):
+            return fn()
+        key, target = self._key(name, args)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            if self._valid(name, target, entry[0]):
+                with self._lock:
+                    self._counters["cache_hits"] += 1
+                return entry[1]
+            with self._lock:
+                self._counters["cache_stale"] += 1
+        with self._lock:
+            self._counters["cache_misses"] += 1
+        # Fingerprints are taken before or during the call, so a change made
+        # while it runs is never masked.
+        fingerprint = _file_fingerprint(target) if name == "read_file" else None
+        result = fn()
+        if name == "list_files":
+            stamps = getattr(result, "dirs", None)
+            fingerprint = tuple(stamps) if stamps else None
+        if fingerprint is not None and not (isinstance(result, str) and result.startswith("error:")):
+            with self._lock:
+                self._entries[key] = (fingerprint, result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries)}
+
+    def _key(self, name: str, args: Dict[str, Any]) -> Tuple[Tuple[str, str, str], str]:
+        target = _resolve(str(args.get("path", ".")))
+        rest = {k: v for k, v in args.items() if k != "path"}
+        return (name, target, json.dumps(rest, sort_keys=True, default=str)), target
+
+    def _valid(self, name: str, target: str, fingerprint: Any) -> bool:
+        if name == "read_file":
+            return _file_fingerprint(target) == fingerprint
+        return _unchanged(fingerprint)
+
+    def _invalidate(self, name: str, args: Dict[str, Any]) -> None:
+        with self._lock:
+            if name == "run_command" or "path" not in args:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                written = _resolve(str(args["path"]))
+                stale = [
+                    key
+                    for key in self._entries
+                    if key[1] == written or (key[0] == "list_files" and written.startswith(key[1].rstrip(os.sep) + os.sep))
+                ]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+            self._counters["invalidations"] += dropped
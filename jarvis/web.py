@@ -2,15 +2,18 @@
 
 import json
 import os
-import socket
 import subprocess
 import sys
-import urllib.request
+import threading
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import urlparse
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
 
-from jarvis.config import get_settings
+from jarvis.cache import ResponseCache
+from jarvis.config import Settings, get_settings
+from jarvis.ollama import get_client
+from jarvis.protocol import ConnectionPool
 
 FAVICON_SVG = b"""<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 64 64'>
   <rect width='64' height='64' rx='14' fill='#0b0f15'/>
@@ -263,6 +266,7 @@ HTML = r"""
       let activeMode = 'general';
       let useOpenAI = false;
       let useStream = true;
+      const sessionId = (crypto.randomUUID ? crypto.randomUUID() : String(Date.now()) + Math.random());
 
       function addBubble(text, who) {
         const el = document.createElement('div');
@@ -304,7 +308,7 @@ HTML = r"""
           const res = await fetch('/api/send', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message: msg })
+            body: JSON.stringify({ message: msg, session: sessionId })
           });
           const data = await res.json();
           addBubble(data.reply || 'ok', 'jarvis');
@@ -352,14 +356,14 @@ HTML = r"""
           const res = await fetch('/api/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message: msg })
+            body: JSON.stringify({ message: msg, session: sessionId })
           });
           const reader = res.body.getReader();
           const decoder = new TextDecoder();
           while (true) {
             const { value, done } = await reader.read();
             if (done) break;
-            const chunk = decoder.decode(value);
+            const chunk = decoder.decode(value, { stream: true });
             bubble.textContent += chunk;
             chat.scrollTop = chat.scrollHeight;
           }
@@ -389,11 +393,23 @@ HTML = r"""
 """
 
 
-def _send_command(host: str, port: int, message: str, timeout: float = 2.0) -> str:
-    with socket.create_connection((host, port), timeout=timeout) as sock:
-        sock.settimeout(timeout)
-        sock.sendall((message + "\n").encode("utf-8"))
-        return sock.recv(4096).decode("utf-8", errors="ignore").strip()
+_pools: dict[tuple[str, int], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(host: str, port: int) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = ConnectionPool(host, port, size=int(os.getenv("JARVIS_UI_POOL_SIZE", "4")))
+            _pools[(host, port)] = pool
+        return pool
+
+
+def _send_command(
+    host: str, port: int, message: str, timeout: float = 2.0, session: str | None = None
+) -> str:
+    return _get_pool(host, port).request(message, timeout=timeout, session=session)
 
 
 def _ensure_server_running() -> None:
@@ -410,31 +426,94 @@ def _ensure_server_running() -> None:
         )
 
 
-def _ollama_generate(prompt: str) -> str:
-    model = os.getenv("JARVIS_OLLAMA_CHAT_MODEL", "gemma:2b")
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {"num_predict": 128},
-    }
-    data = json.dumps(payload).encode("utf-8")
+_UI_OPTIONS = {"num_predict": 128}
+_response_cache: ResponseCache | None = None
+_response_cache_lock = threading.Lock()
+
+
+def _ui_options(settings: Settings) -> dict:
+    # Same num_ctx as the runner and warmer, so Ollama never reloads the model to switch windows.
+    return {**_UI_OPTIONS, "num_ctx": settings.ollama_num_ctx}
+
+
+def _get_response_cache() -> ResponseCache | None:
+    global _response_cache
+    settings = get_settings()
+    if settings.cache_size <= 0:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(settings.cache_size, settings.cache_ttl)
+        return _response_cache
+
+
+def _ollama_generate(prompt: str, use_cache: bool = True) -> str:
+    settings = get_settings()
+    cache = _get_response_cache() if use_cache else None
+    options = _ui_options(settings)
+    key = ResponseCache.make_key(settings.ollama_chat_model, prompt, options)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
     try:
-        req = urllib.request.Request(
-            "http://127.0.0.1:11434/api/generate",
-            data=data,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            raw = resp.read().decode("utf-8", errors="ignore")
-        out = json.loads(raw)
-        return out.get("response", "").strip()
+        out = get_client(settings).generate(settings.ollama_chat_model, prompt, options=options)
+        reply = out.get("response", "").strip()
     except Exception as exc:
         return f"error: {exc}"
+    if cache is not None and reply:
+        cache.put(key, reply)
+    return reply
+
+
+def _ollama_stream(prompt: str, use_cache: bool = True) -> Iterator[str]:
+    settings = get_settings()
+    cache = _get_response_cache() if use_cache else None
+    options = _ui_options(settings)
+    key = ResponseCache.make_key(settings.ollama_chat_model, prompt, options)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    chunks = get_client(settings).generate_stream(settings.ollama_chat_model, prompt, options=options)
+    parts = []
+    try:
+        for chunk in chunks:
+            text = chunk.get("response", "")
+            if text:
+                parts.append(text)
+                yield text
+    finally:
+        # Closing the upstream stream makes Ollama stop generating.
+        chunks.close()
+    # Only completed generations are cached; aborted streams never get here.
+    reply = "".join(parts).strip()
+    if cache is not None and reply:
+        cache.put(key, reply)
+
+
+def _runner_stream(message: str, session: str | None = None) -> Iterator[str]:
+    settings = get_settings()
+    deltas = _get_pool(settings.server_host, settings.server_port).stream(message, timeout=120.0, session=session)
+    try:
+        first = next(deltas, None)
+    except ConnectionError:
+        # Runner is down: start it for next time and answer straight from Ollama.
+        _ensure_server_running()
+        yield from _ollama_stream(message)
+        return
+    try:
+        if first is not None:
+            yield first
+        yield from deltas
+    finally:
+        deltas.close()
 
 
 class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
     def _json(self, data: dict, status: int = 200) -> None:
         payload = json.dumps(data).encode("utf-8")
         self.send_response(status)
@@ -443,8 +522,50 @@ class _Handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(payload)
 
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, chunks: Iterator[str]) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            try:
+                for text in chunks:
+                    self._write_chunk(text.encode("utf-8", errors="ignore"))
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as exc:
+                self._write_chunk(f"error: {exc}".encode("utf-8", errors="ignore"))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Browser went away; stop pulling tokens from upstream.
+            self.close_connection = True
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+
     def do_GET(self) -> None:
-        path = urlparse(self.path).path
+        parsed = urlparse(self.path)
+        path = parsed.path
+        if path == "/api/history":
+            query = parse_qs(parsed.query).get("q", [""])[0].strip()
+            if not query:
+                self._json({"results": [], "error": "missing q"}, status=400)
+                return
+            settings = get_settings()
+            try:
+                raw = _send_command(settings.server_host, settings.server_port, f"/history search {query}", timeout=5.0)
+                self._json({"results": json.loads(raw)})
+            except Exception as exc:
+                self._json({"results": [], "error": str(exc)}, status=502)
+            return
+
         if path == "/api/status":
             settings = get_settings()
             key_present = bool(os.getenv("OPENAI_API_KEY"))
@@ -504,12 +625,10 @@ class _Handler(BaseHTTPRequestHandler):
             if not message:
                 self._json({"reply": "empty message"}, status=400)
                 return
-            # Stream local Ollama output
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.end_headers()
-            reply = _ollama_generate(message)
-            self.wfile.write(reply.encode("utf-8", errors="ignore"))
+            if os.getenv("JARVIS_UI_DIRECT", "1") != "1":
+                self._stream(_runner_stream(message, payload.get("session") or None))
+                return
+            self._stream(_ollama_stream(message, use_cache=payload.get("cache", True) is not False))
             return
 
         if path != "/api/send":
@@ -530,23 +649,28 @@ class _Handler(BaseHTTPRequestHandler):
             return
 
         settings = get_settings()
+        session = payload.get("session") or None
         direct_ui = os.getenv("JARVIS_UI_DIRECT", "1") == "1"
         if not direct_ui:
             try:
-                reply = _send_command(settings.server_host, settings.server_port, message, timeout=120.0)
+                reply = _send_command(
+                    settings.server_host, settings.server_port, message, timeout=120.0, session=session
+                )
                 self._json({"reply": reply or "ok"})
                 return
             except Exception:
                 _ensure_server_running()
                 try:
-                    reply = _send_command(settings.server_host, settings.server_port, message, timeout=120.0)
+                    reply = _send_command(
+                        settings.server_host, settings.server_port, message, timeout=120.0, session=session
+                    )
                     self._json({"reply": reply or "ok"})
                     return
                 except Exception:
                     pass
 
         # Direct Ollama fallback (chat without backend)
-        reply = _ollama_generate(message)
+        reply = _ollama_generate(message, use_cache=payload.get("cache", True) is not False)
         self._json({"reply": reply or "ok"})
 
     def log_message(self, format: str, *args: object) -> None:
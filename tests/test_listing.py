@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import pytest
+
+from jarvis.listing import walk_files
+
+
+@pytest.mark.parametrize("pattern", ["*.py", "**/*.py", "src/*.py", "src/**/*.py", "?.py", "*.txt"])
+def test_walk_files_matches_rglob(tmp_path, pattern):
+    for name in ("a.py", "b.txt", "src/b.py", "src/deep/c.py", "lib/src/d.py"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x", encoding="utf-8")
+
+    found = sorted(entry.path for entry in walk_files(str(tmp_path), pattern, include_ignored=True))
+    expected = sorted(str(path) for path in tmp_path.rglob(pattern) if path.is_file())
+    assert found == expected
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from jarvis.memory import MemoryStore
+
+THREADS = 24
+ROUNDS = 300
+
+
+@pytest.mark.parametrize("async_events", [True, False])
+def test_interleaved_get_set_log_event(tmp_path, async_events):
+    store = MemoryStore(str(tmp_path / "memory.db"), async_events=async_events)
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def worker(index: int) -> None:
+        try:
+            start.wait()
+            key = f"key-{index}"
+            for round_ in range(ROUNDS):
+                store.set(key, str(round_))
+                assert store.get(key) == str(round_)
+                store.set("shared", f"{index}:{round_}")
+                assert store.get("shared") is not None
+                store.log_event("stress", f"{index}:{round_}")
+        except BaseException as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert not errors, errors[0]
+        store.flush()
+        assert sum(1 for _ in store.iter_events(event_type="stress")) == THREADS * ROUNDS
+        for index in range(THREADS):
+            assert store.get(f"key-{index}") == str(ROUNDS - 1)
+        store.invalidate_kv()
+        assert store.get(f"key-{THREADS - 1}") == str(ROUNDS - 1)
+    finally:
+        store.close()
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import pytest
+
+from jarvis.memory import MemoryStore, _events_query
+
+
+@pytest.mark.parametrize("since, until", [(None, None), (0.0, None), (0.0, 1e12)])
+def test_typed_event_pages_walk_an_index(tmp_path, since, until):
+    store = MemoryStore(str(tmp_path / "memory.db"), async_events=False)
+    try:
+        sql, params = _events_query("command", since, until, 0, 500)
+        plan = " ".join(row[-1] for row in store._reader().execute("EXPLAIN QUERY PLAN " + sql, params))
+        # A temp B-tree would re-sort every remaining row of the type on each page.
+        assert "TEMP B-TREE" not in plan
+        assert "idx_events_type_id" in plan
+    finally:
+        store.close()
+
+
+def test_iter_events_by_type(tmp_path):
+    store = MemoryStore(str(tmp_path / "memory.db"), async_events=False)
+    try:
+        for index in range(1000):
+            store.log_event("command" if index % 3 == 0 else "reply", str(index))
+        payloads = [event["payload"] for event in store.iter_events(event_type="command", page_size=50)]
+        assert payloads == [str(index) for index in range(0, 1000, 3)]
+    finally:
+        store.close()